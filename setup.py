@@ -25,7 +25,7 @@ setup(
     package_dir={'': 'src'},
     packages=find_packages(where='src'),
     python_requires='>=3.6, <4',
-    install_requires=['jinja2', 'openpyxl', 'pyyaml', 'tabulate', 'gitpython'],
+    install_requires=['jinja2', 'openpyxl', 'pyyaml', 'gitpython'],
     entry_points={
         "console_scripts": [
             "cvdb = covicdbtools.cli:main",
@@ -8,6 +8,7 @@ from io import BytesIO
 
 from covicdbtools import (
     config,
+    datasets,
     names,
     tables,
     grids,
@@ -18,83 +19,84 @@ from covicdbtools import (
 from covicdbtools.responses import success, failure, failed
 
 
-hosts = list(config.hosts.keys())
-
-isotypes = [i["label"] for i in config.isotypes.values()]
-light_chains = [i["label"] for i in config.light_chains.values()]
-heavy_chain_germline = [i["label"] for i in config.heavy_chain_germline.values()]
-
-
-headers = [
-    {
-        "value": "ab_name",
-        "label": "Antibody name",
-        "description": "Your preferred code name for the antibody",
-        "locked": True,
-        "required": True,
-        "unique": True,
-    },
-    {
-        "value": "host_label",
-        "label": "Host",
-        "description": "Specify the host species that is the source of the antibody",
-        "locked": True,
-        "required": True,
-        "terminology": hosts,
-        "validations": [
-            {
-                "type": "list",
-                "formula1": "=Terminology!$A$2:$A${0}".format(len(hosts) + 1),
-                "allow_blank": True,
-            }
-        ],
-    },
-    {
-        "value": "isotype_label",
-        "label": "Isotype",
-        "description": "Specify the antibody isotype, if known",
-        "locked": True,
-        "terminology": isotypes,
-        "validations": [
-            {
-                "type": "list",
-                "formula1": "=Terminology!$B$2:$B${0}".format(len(isotypes) + 1),
-                "allow_blank": True,
-            }
-        ],
-    },
-    {
-        "value": "light_chain_label",
-        "label": "Light chain",
-        "description": "Specify the antibody light chain, if known (kappa or lambda)",
-        "locked": True,
-        "terminology": light_chains,
-        "validations": [
-            {
-                "type": "list",
-                "formula1": "=Terminology!$C$2:$C${0}".format(len(light_chains) + 1),
-                "allow_blank": True,
-            }
-        ],
-    },
-    {
-        "value": "heavy_chain_germline_label",
-        "label": "Heavy chain germline",
-        "description": "Specify the antibody heavy chain germline gene, if known",
-        "locked": True,
-        "terminology": heavy_chain_germline,
-        "validations": [
-            {
-                "type": "list",
-                "formula1": "=Terminology!$D$2:$D${0}".format(len(heavy_chain_germline) + 1),
-                "allow_blank": True,
-            }
-        ],
-    },
-    {
-        "value": "ab_details",
-        "label": "Antibody details",
-        "description": """Measurements or characteristics of the antibody.
+def get_headers():
+    """Return the list of headers for the antibodies submission template,
+    built from the current config."""
+    hosts = list(config.hosts.keys())
+    isotypes = [i["label"] for i in config.isotypes.values()]
+    light_chains = [i["label"] for i in config.light_chains.values()]
+    heavy_chain_germline = [i["label"] for i in config.heavy_chain_germline.values()]
+
+    return [
+        {
+            "value": "ab_name",
+            "label": "Antibody name",
+            "description": "Your preferred code name for the antibody",
+            "locked": True,
+            "required": True,
+            "unique": True,
+        },
+        {
+            "value": "host_label",
+            "label": "Host",
+            "description": "Specify the host species that is the source of the antibody",
+            "locked": True,
+            "required": True,
+            "terminology": hosts,
+            "validations": [
+                {
+                    "type": "list",
+                    "formula1": "=Terminology!$A$2:$A${0}".format(len(hosts) + 1),
+                    "allow_blank": True,
+                }
+            ],
+        },
+        {
+            "value": "isotype_label",
+            "label": "Isotype",
+            "description": "Specify the antibody isotype, if known",
+            "locked": True,
+            "terminology": isotypes,
+            "validations": [
+                {
+                    "type": "list",
+                    "formula1": "=Terminology!$B$2:$B${0}".format(len(isotypes) + 1),
+                    "allow_blank": True,
+                }
+            ],
+        },
+        {
+            "value": "light_chain_label",
+            "label": "Light chain",
+            "description": "Specify the antibody light chain, if known (kappa or lambda)",
+            "locked": True,
+            "terminology": light_chains,
+            "validations": [
+                {
+                    "type": "list",
+                    "formula1": "=Terminology!$C$2:$C${0}".format(len(light_chains) + 1),
+                    "allow_blank": True,
+                }
+            ],
+        },
+        {
+            "value": "heavy_chain_germline_label",
+            "label": "Heavy chain germline",
+            "description": "Specify the antibody heavy chain germline gene, if known",
+            "locked": True,
+            "terminology": heavy_chain_germline,
+            "validations": [
+                {
+                    "type": "list",
+                    "formula1": "=Terminology!$D$2:$D${0}".format(len(heavy_chain_germline) + 1),
+                    "allow_blank": True,
+                }
+            ],
+        },
+        {
+            "value": "ab_details",
+            "label": "Antibody details",
+            "description": """Measurements or characteristics of the antibody.
 This column is optional, and meant to capture data you might have on the antibody.
 These data will not be released to the partner reference labs that will perform the analyses.
 For example:
@@ -102,28 +104,36 @@ For example:
 - Neutralization: IC50 value
 - Neutralization assay platform
 - Epitope: Binning or competition data""",
-        "locked": True,
-    },
-    {
-        "value": "ab_structure",
-        "label": "Structural data",
-        "description": """Would you like structural analyses of this antibody?
+            "locked": True,
+        },
+        {
+            "value": "ab_structure",
+            "label": "Structural data",
+            "description": """Would you like structural analyses of this antibody?
 If no, leave blank.
 If yes, rank the antibodies in order of priority, starting with '1' for the highest priority.""",
-        "type": "integer",
-        "locked": True,
-    },
-    {
-        "value": "ab_comment",
-        "label": "Antibody comment",
-        "description": "Please provide any other details about the antibody.",
-        "locked": True,
-    },
-]
+            "type": "integer",
+            "locked": True,
+        },
+        {
+            "value": "ab_comment",
+            "label": "Antibody comment",
+            "description": "Please provide any other details about the antibody.",
+            "locked": True,
+        },
+    ]
+
+
+def __getattr__(name):
+    """Build the headers when `antibodies.headers` is first used."""
+    if name == "headers":
+        return get_headers()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
 def fill(rows=[]):
     """Fill the antibodies submission template, returning a list of grids."""
+    headers = get_headers()
     instructions_rows = []
     instructions = """CoVIC-DB Antibodies Submission
 Version 1.2.3
@@ -183,7 +193,7 @@ def validate(table):
     """Given a table,
     validate it and return a response with "grid" and maybe "errors",
     and an Excel file as "content"."""
-    response = submissions.validate(headers, table)
+    response = submissions.validate(get_headers(), table)
     grids = fill(response["grid"]["rows"])
     content = BytesIO()
     workbooks.write(grids, content)
@@ -192,11 +202,23 @@ def validate(table):
     return response
 
 
+def read_last_id(path):
+    """Given the path to an antibodies table,
+    return the last antibody ID without reading the whole table,
+    or None if there are no antibodies."""
+    if not os.path.isfile(path):
+        return None
+    row = tables.read_last_row(path)
+    if not row:
+        return None
+    return row["ab_id"]
+
+
 def submit(name, email, organization, table):
     """Given a new table of antibodies:
     1. validate it
     2. assign IDs and append them to the secrets,
-    3. append the blinded antibodies to the staging table,
+    3. append the blinded antibodies to the staging and public tables,
     4. return a response with merged IDs."""
     response = validate(table)
     if failed(response):
@@ -205,20 +227,26 @@ def submit(name, email, organization, table):
 
     if not config.secret:
         return failure("CVDB_SECRET directory is not configured")
-    secret = []
-    path = os.path.join(config.secret.working_tree_dir, "antibodies.tsv")
-    if os.path.isfile(path):
-        secret = tables.read_tsv(path)
-
-    blind = config.read_blinded_antibodies()
+    if not config.staging:
+        return failure("CVDB_STAGING directory is not configured")
+    if not config.public:
+        return failure("CVDB_PUBLIC directory is not configured")
 
-    if len(secret) != len(blind):
-        return failure(f"Different number of antibody rows: {len(secret)} != {len(blind)}")
+    # IDs are assigned in sequence,
+    # so the secret, staging, and public tables match when their last IDs match.
+    secret_id = read_last_id(os.path.join(config.secret.working_tree_dir, "antibodies.tsv"))
+    blind_id = read_last_id(os.path.join(config.staging.working_tree_dir, "antibodies.tsv"))
+    public_id = read_last_id(os.path.join(config.public.working_tree_dir, "antibodies.tsv"))
+    if secret_id != blind_id:
+        return failure(f"Different last antibody IDs: {secret_id} != {blind_id}")
+    if public_id != blind_id:
+        return failure(f"Different last public antibody ID: {public_id} != {blind_id}")
 
-    current_id = "COVIC:0"
-    if len(blind) > 0:
-        current_id = blind[-1]["ab_id"]
+    current_id = blind_id or "COVIC:0"
 
+    headers = get_headers()
+    secret = []
+    blind = []
     submission = []
     for row in table:
         current_id = names.increment_id(current_id)
@@ -263,7 +291,7 @@ def submit(name, email, organization, table):
     # secret
     try:
         path = os.path.join(config.secret.working_tree_dir, "antibodies.tsv")
-        tables.write_tsv(secret, path)
+        tables.append_tsv(secret, path)
     except Exception as e:
         return failure(f"Failed to write '{path}'", {"exception": e})
     try:
@@ -275,21 +303,21 @@ def submit(name, email, organization, table):
     # staging
     try:
         path = os.path.join(config.staging.working_tree_dir, "antibodies.tsv")
-        tables.write_tsv(blind, path)
+        tables.append_tsv(blind, path)
     except Exception as e:
         return failure(f"Failed to write '{path}'", {"exception": e})
     try:
+        head = datasets.get_head(config.staging)
         config.staging.index.add([path])
         config.staging.index.commit("Submit antibodies", author=author, committer=config.covic)
     except Exception as e:
         return failure(f"Failed to commit '{path}'", {"exception": e})
+    datasets.update_catalog([], head)
 
     # public
-    if not config.public:
-        return failure("CVDB_PUBLIC directory is not configured")
     try:
         path = os.path.join(config.public.working_tree_dir, "antibodies.tsv")
-        tables.write_tsv(blind, path)
+        tables.append_tsv(blind, path)
     except Exception as e:
         return failure(f"Failed to write '{path}'", {"exception": e})
     try:
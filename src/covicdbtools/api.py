@@ -3,7 +3,7 @@
 import os
 
 from io import BytesIO
-from collections import OrderedDict
+from itertools import chain
 from covicdbtools import (
     config,
     names,
@@ -61,8 +61,10 @@ def read_path(path, sheet=None):
 
 
 def read(source, sheet=None):
-    """Read a source and return a response with a "table" key."""
-    if tables.is_table(source):
+    """Read a source and return a response with a "table" key.
+    Tables from our readers are only spot-checked here, and plain lists are fully checked."""
+    quick = isinstance(source, (tables.Table, tables.ValidTable))
+    if tables.is_table(source, quick=quick):
         return success({"table": source})
     if responses.is_response(source):
         if "table" in source:
@@ -80,6 +82,36 @@ def read(source, sheet=None):
     raise Exception(f"Unknown input '{source}'")
 
 
+def read_rows(source, sheet=None, offset=0, limit=None, columns=None):
+    """Read a source and return a response with a "rows" iterator,
+    starting at the offset, with at most limit rows, and only the given columns.
+    TSV files are streamed, so only the rows that are used are read."""
+    if offset < 0 or (limit is not None and limit < 0):
+        return failure("Offset and limit must not be negative")
+    if isinstance(source, str) and source.lower().endswith(".tsv"):
+        if columns:
+            header = tables.read_tsv_header(source)
+            missing = [column for column in columns if column not in header]
+            if missing:
+                return failure(f"Unknown columns: {', '.join(missing)}")
+        return success({"rows": tables.iter_tsv(source, offset, limit, columns)})
+    else:
+        response = read(source, sheet)
+        if failed(response):
+            return response
+        rows = iter(response["table"])
+
+    first = next(rows, None)
+    if first is None:
+        return success({"rows": iter([])})
+    if columns:
+        missing = [column for column in columns if column not in first]
+        if missing:
+            return failure(f"Unknown columns: {', '.join(missing)}")
+    rows = chain([first], rows)
+    return success({"rows": tables.slice_rows(rows, offset, limit, columns)})
+
+
 def convert(source, destination):
     """Given a source and a destimation (format or path)
     convert the table to that format
@@ -167,28 +199,62 @@ def fetch_template(datatype):
     return fill_rows(datatype)
 
 
-def fetch_data(datatype):
-    """Fetch the template for a given datatype."""
+# The artifacts that fetch_data can build: "content" is the filled XLSX workbook.
+fetch_artifacts = ["table", "label_table", "grid", "content"]
+
+
+def label_assays(datatype, table):
+    """Given a datatype and a Table of assays,
+    return a Table that shares its column lists under their human-readable labels."""
+    labels = {"ab_id": "Antibody"}
+    for header in datasets.get_assay_headers(datatype):
+        labels[header["value"]] = header["label"]
+    header = [labels.get(key, key) for key in table.header]
+    return tables.Table(header, table.columns, table.validated, copy=False)
+
+
+def fetch_data(datatype, offset=0, limit=None, columns=None, include=None, as_rows=False):
+    """Fetch the template for a given datatype, filled with its data.
+    Given an offset, a limit, and a list of columns,
+    only that page of rows is read, with only those columns.
+    Given a list of artifacts to include (see fetch_artifacts),
+    only those are built; by default all of them are.
+    Rows with just some of the columns do not fit the template,
+    so when columns are given the response has no workbook.
+    The "table" and "label_table" are columnar Tables that share their columns.
+    They cannot be serialized as JSON, so when as_rows is True
+    they are converted to lists of OrderedDicts instead, at the cost of one dict per row."""
     if datatype.lower() == "antibodies":
         raise Exception("Not yet implemented")
-    else:
-        dataset_path = os.path.join(
-            os.environ.get("CVDB_DATA"), "staging", "datasets", datatype, "assays.tsv"
-        )
-        result = fill(datatype, dataset_path)
-        label_table = []
-        headers = datasets.get_assay_headers(datatype)
-        labels = {"ab_id": "Antibody"}
-        for header in headers:
-            labels[header["value"]] = header["label"]
-        for row in result["table"]:
-            new_row = OrderedDict()
-            for column, value in row.items():
-                label = labels.get(column, column)
-                new_row[label] = value
-            label_table.append(new_row)
-        result["label_table"] = label_table
-        return result
+    if include is None:
+        include = fetch_artifacts
+    unknown = [artifact for artifact in include if artifact not in fetch_artifacts]
+    if unknown:
+        return failure(f"Unknown artifacts: {', '.join(unknown)}")
+    if offset < 0 or (limit is not None and limit < 0):
+        return failure("Offset and limit must not be negative")
+
+    dataset_path = os.path.join(datasets.get_staging_path(datatype), "assays.tsv")
+    try:
+        table = tables.read_tsv_page(dataset_path, offset, limit, columns)
+    except Exception as e:
+        return failure(e)
+
+    result = success({})
+    if "table" in include:
+        result["table"] = table.to_rows() if as_rows else table
+    if "label_table" in include:
+        label_table = label_assays(datatype, table)
+        result["label_table"] = label_table.to_rows() if as_rows else label_table
+    if "grid" in include or ("content" in include and not columns):
+        grid = {"headers": [[]], "rows": []}
+        if len(table) > 0:
+            grid = grids.table_to_grid(config.prefixes, config.fields, table)
+        if "grid" in include:
+            result["grid"] = grid
+        if "content" in include and not columns:
+            result.update(fill_rows(datatype, grid["rows"]))
+    return result
 
 
 def validate(datatype, source):
@@ -228,6 +294,16 @@ def set_value(scope, dataset, key, value):
         return failure(e)
 
 
+def set_values(scope, dataset, values):
+    """Given a scope (staging or secret), a dataset ID,
+    and a dictionary of key strings and simple values,
+    update the dataset metadata with one write and one commit."""
+    try:
+        return datasets.set_values(scope, dataset, values)
+    except Exception as e:
+        return failure(e)
+
+
 def get_value(scope, dataset, key=None):
     """Given a scope (staging or secret), a dataset ID, and an optional key,
     return the value or values in the 'data' key."""
@@ -237,6 +313,15 @@ def get_value(scope, dataset, key=None):
         return failure(e)
 
 
+def list_datasets(filter=None):
+    """Given an optional filter dictionary with a "status" and/or a list of "columns",
+    return a response with a "datasets" list from the dataset catalog."""
+    try:
+        return success({"datasets": datasets.list_datasets(filter)})
+    except Exception as e:
+        return failure(e)
+
+
 def submit_antibodies(name, email, organization, source):
     """Given the submitter's name, email, organization, and a source
     validate and submit a set of antibodies.
@@ -248,18 +333,26 @@ def submit_antibodies(name, email, organization, source):
     return antibodies.submit(name, email, organization, table)
 
 
-def submit_assays(name, email, dataset_id, source):
-    """Given the submitter's name and email, an existing dataset ID, and a source
+def submit_assays(name, email, dataset_id, source, mode="replace"):
+    """Given the submitter's name and email, an existing dataset ID, a source,
+    and a mode (replace, append, or upsert),
     validate it and submit a set of assays.
     A successful response will include a table of submitted data."""
     response = validate(dataset_id, source)
     if failed(response):
         return response
     table = response["table"]
-    return datasets.submit(name, email, dataset_id, table)
+    return datasets.submit(name, email, dataset_id, table, mode=mode)
 
 
 def promote_dataset(name, email, dataset_id):
     """Given a user name, email, and a dataset ID,
     promote the dataset from staging to production."""
     return datasets.promote(name, email, dataset_id)
+
+
+def promote_datasets(name, email, dataset_ids):
+    """Given the promoter's name and email and a list of dataset IDs,
+    promote all the datasets from staging to public together,
+    with one commit to each repository."""
+    return datasets.promote_datasets(name, email, dataset_ids)
@@ -23,6 +23,17 @@ def guard(response):
     sys.exit(1)
 
 
+def non_negative_int(value):
+    """Given a command-line string, return it as a non-negative integer."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not an integer")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"'{value}' must not be negative")
+    return number
+
+
 def initialize(args):
     """Create the global data repositories."""
     api.initialize()
@@ -30,8 +41,11 @@ def initialize(args):
 
 def read(args):
     """Read a table and print to STDOUT."""
-    response = guard(api.read(args.input, args.sheet))
-    tables.print_tsv(response["table"])
+    columns = None
+    if args.columns:
+        columns = args.columns.split(",")
+    response = guard(api.read_rows(args.input, args.sheet, args.offset, args.limit, columns))
+    tables.print_rows(response["rows"])
 
 
 def expand(args):
@@ -66,7 +80,7 @@ def fetch_template(args):
 
 def fetch_data(args):
     """Fetch the filled template for a given data type, then write it."""
-    response = guard(api.fetch_data(args.type))
+    response = guard(api.fetch_data(args.type, args.offset, args.limit, include=["content"]))
     response["path"] = args.output
     responses.write(response)
 
@@ -97,7 +111,7 @@ def submit_antibodies(args):
 
 def submit_assays(args):
     """Submit a table, validate, store, and optionally write the result."""
-    response = api.submit_assays(args.name, args.email, args.id, args.input)
+    response = api.submit_assays(args.name, args.email, args.id, args.input, mode=args.mode)
     guard(maybe_write(response, args.id, args.output))
 
 
@@ -108,8 +122,25 @@ def create_dataset(args):
 
 
 def set_value(args):
-    """Set a metadata value for a dataset."""
-    guard(api.set_value(args.scope, args.dataset, args.key, args.value))
+    """Set a metadata value for a dataset,
+    or set all the values in a TSV file with 'key' and 'value' columns."""
+    if args.from_file:
+        if args.key or args.value:
+            sys.exit("Do not give a key and value with --from-file")
+        header = tables.read_tsv_header(args.from_file)
+        missing = [column for column in ["key", "value"] if column not in header]
+        if missing:
+            sys.exit(f"Missing column(s) in {args.from_file}: {', '.join(missing)}")
+        values = {}
+        for row in tables.iter_tsv(args.from_file):
+            values[row["key"]] = row["value"]
+        if not values:
+            sys.exit(f"No values in {args.from_file}")
+        guard(api.set_values(args.scope, args.dataset, values))
+    elif args.key and args.value is not None:
+        guard(api.set_value(args.scope, args.dataset, args.key, args.value))
+    else:
+        sys.exit("Give a key and value, or --from-file")
 
 
 def get_value(args):
@@ -124,6 +155,11 @@ def promote_dataset(args):
     guard(api.promote_dataset(args.name, args.email, args.id))
 
 
+def promote_datasets(args):
+    """Promote several datasets from staging to public together."""
+    guard(api.promote_datasets(args.name, args.email, args.ids))
+
+
 def main():
     main_parser = argparse.ArgumentParser()
     subparsers = main_parser.add_subparsers(required=True, dest="cmd")
@@ -134,6 +170,13 @@ def main():
     parser = subparsers.add_parser("read", help="Read a table to STDOUT")
     parser.add_argument("input", help="The table file to read")
     parser.add_argument("sheet", help="The sheet to read", nargs="?", default=None)
+    parser.add_argument(
+        "--offset", type=non_negative_int, default=0, help="The number of rows to skip"
+    )
+    parser.add_argument(
+        "--limit", type=non_negative_int, help="The maximum number of rows to print"
+    )
+    parser.add_argument("--columns", help="The columns to print")
     parser.set_defaults(func=read)
 
     parser = subparsers.add_parser("convert", help="Convert a table to another format")
@@ -163,6 +206,12 @@ def main():
     parser = subsubparsers.add_parser("data", help="Fetch a filled template")
     parser.add_argument("type", help="The type of template to fetch")
     parser.add_argument("output", help="The output file to write")
+    parser.add_argument(
+        "--offset", type=non_negative_int, default=0, help="The number of rows to skip"
+    )
+    parser.add_argument(
+        "--limit", type=non_negative_int, help="The maximum number of rows to fetch"
+    )
     parser.set_defaults(func=fetch_data)
 
     parser = subparsers.add_parser("validate", help="Validate data")
@@ -186,6 +235,12 @@ def main():
     parser.add_argument("id", help="The dataset id")
     parser.add_argument("input", help="The input file to submit")
     parser.add_argument("output", help="The output file to write", nargs="?")
+    parser.add_argument(
+        "--mode",
+        choices=["replace", "append", "upsert"],
+        default="replace",
+        help="Replace all assays, append new rows, or update rows with the same replicate key",
+    )
     parser.set_defaults(func=submit_assays)
 
     parser = subparsers.add_parser("create", help="Create a new entry")
@@ -201,8 +256,12 @@ def main():
         "scope", choices=["secret", "staging"], help="The data scope: secret or staging"
     )
     parser.add_argument("dataset", help="The dataset ID")
-    parser.add_argument("key", help="The key to set")
-    parser.add_argument("value", help="The value to set")
+    parser.add_argument("key", nargs="?", help="The key to set")
+    parser.add_argument("value", nargs="?", help="The value to set")
+    parser.add_argument(
+        "--from-file",
+        help="A TSV file with 'key' and 'value' columns to set together in one commit",
+    )
     parser.set_defaults(func=set_value)
 
     parser = subparsers.add_parser("get", help="Get metadata values for a configured dataset")
@@ -222,6 +281,13 @@ def main():
     parser.add_argument("email", help="The submitter's email")
     parser.add_argument("id", help="The dataset ID to promote")
     parser.set_defaults(func=promote_dataset)
+    parser = subsubparsers.add_parser(
+        "datasets", help="Promote several datasets from staging to public in one commit"
+    )
+    parser.add_argument("name", help="The submitter's name")
+    parser.add_argument("email", help="The submitter's email")
+    parser.add_argument("ids", nargs="+", help="The dataset IDs to promote")
+    parser.set_defaults(func=promote_datasets)
 
     args = main_parser.parse_args()
     args.func(args)
@@ -5,38 +5,86 @@
 # written to JSON, and loaded from JSON.
 
 import argparse
+import hashlib
 import json
+import marshal
+import mmap
 import os
+import re
+import struct
+import sys
+import threading
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 from git import Actor, Repo
 from covicdbtools import tables
 
-
-# Global config dictionaries.
-fields = {}
-prefixes = {}
-core = {}
-ab_controls = {}
-hosts = {}
-isoforms = {}
-light_chains = {}
-heavy_chain_germline = {}
-assays = {}
-parameters = {}
-qualitative_measures = {}
-death_reason = {}
-animal_model_strain = {}
-labels = {}
-ids = {}
-
-
-# Global git repositories
-secret = None
-staging = None
-public = None
+# Global config dictionaries and git repositories.
+# These are loaded on first access, by the module __getattr__ below,
+# so that importing this module does not read config.json or open repositories.
+# Long-running servers can call warm() to load everything up front.
+#
+# The config dictionaries are held together in one immutable State,
+# which reload() replaces with a single assignment,
+# so a concurrent reader sees either the old config or the new one, never a mix.
+# Code that reads several dictionaries and needs them to agree
+# should call get_state() once and use its attributes.
+# The dictionaries are shared and must be treated as read-only.
+config_keys = [
+    "fields",
+    "prefixes",
+    "core",
+    "ab_controls",
+    "hosts",
+    "isotypes",
+    "light_chains",
+    "heavy_chain_germline",
+    "assays",
+    "parameters",
+    "qualitative_measures",
+    "death_reason",
+    "animal_model_strain",
+    "labels",
+    "ids",
+    "columns",
+    "term_index",
+    "term_labels",
+]
+repo_names = ["secret", "staging", "public"]
 covic = Actor("CoVIC", "covic@lji.org")
 
+State = namedtuple("State", ["version", "path", "stamp"] + config_keys)
+state = None
+state_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Load the global config dictionaries or git repositories on first access."""
+    if name in config_keys:
+        return getattr(get_state(), name)
+    elif name in repo_names:
+        init_repos()
+    else:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    return globals()[name]
+
+
+def get_state():
+    """Return the current config State, loading the config if needed."""
+    current = state
+    if current is None:
+        update()
+        current = state
+    return current
+
+
+def get_repo(name):
+    """Given the name of a data repository, return it, or None if it is not configured."""
+    if name not in globals():
+        init_repos()
+    return globals()[name]
+
 
 # # Fields
 #
@@ -124,15 +172,47 @@ def read_ids(labels_tsv_path):
 # Read the table of blinded antibodies from Staging.
 
 
-def read_blinded_antibodies():
-    "Return a list of dicts of blinded antibodies"
+# The blinded antibodies are cached for the life of the process,
+# keyed by the path, modification time, and size of staging antibodies.tsv,
+# so that they are only read again when the file changes.
+blinded_cache = {}
+
+
+def get_blinded_antibodies():
+    """Return a dictionary with the "table" of blinded antibodies,
+    a frozenset of their "ab_ids", a frozenset of their "ab_labels",
+    and a map "ids_by_label" from labels to IDs.
+    The result is shared: do not modify it."""
+    staging = get_repo("staging")
     if not staging:
         raise Exception("CVDB_STAGING directory is not configured")
-    blind = []
     path = os.path.join(staging.working_tree_dir, "antibodies.tsv")
-    if os.path.isfile(path):
+    try:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        key = (path, None, None)
+    if blinded_cache.get("key") == key:
+        return blinded_cache["value"]
+
+    blind = []
+    if key[1] is not None:
         blind = tables.read_tsv(path)
-    return blind
+    ids_by_label = OrderedDict((ab["ab_id"].replace(":", "-"), ab["ab_id"]) for ab in blind)
+    value = {
+        "table": blind,
+        "ab_ids": frozenset(ids_by_label.values()),
+        "ab_labels": frozenset(ids_by_label.keys()),
+        "ids_by_label": ids_by_label,
+    }
+    blinded_cache.clear()
+    blinded_cache.update(key=key, value=value)
+    return value
+
+
+def read_blinded_antibodies():
+    "Return a list of dicts of blinded antibodies"
+    return get_blinded_antibodies()["table"]
 
 
 # # Configuration
@@ -172,6 +252,56 @@ def is_config(config):
     return True
 
 
+term_sets = [
+    "core",
+    "ab_controls",
+    "hosts",
+    "isotypes",
+    "light_chains",
+    "heavy_chain_germline",
+    "assays",
+    "parameters",
+    "qualitative_measures",
+    "death_reason",
+    "animal_model_strain",
+]
+
+
+def hash_file(path):
+    """Given a path, return the SHA-256 hex digest of the file content."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def check_duplicates(config, changed=term_sets):
+    """Given a config dictionary and a list of changed term sets,
+    raise an exception if a term in a changed term set
+    has the same ID or label as any other term.
+    Unchanged term sets have already been checked against each other."""
+    ids = set()
+    labels = set()
+    for term_set in term_sets:
+        if term_set not in changed:
+            for label, term in config[term_set].items():
+                ids.add(term["id"])
+                labels.add(label)
+    for term_set in term_sets:
+        if term_set not in changed:
+            continue
+        terms = config[term_set]
+        for label, term in terms.items():
+            id = term["id"]
+            if id in ids:
+                raise Exception(f"Duplicate ID '{id}' in term set '{term_set}'")
+            if label in labels:
+                raise Exception(f"Duplicate label '{label}' in term set '{term_set}'")
+            ids.add(id)
+            labels.add(label)
+
+
 def build(
     prefixes_tsv_path,
     fields_tsv_path,
@@ -187,51 +317,47 @@ def build(
     death_reason_tsv_path,
     animal_model_strain_tsv_path,
     labels_tsv_path,
+    previous=None,
 ):
-    """Read TSV files and return a new config dictionary."""
-    config = {}
-    config["prefixes"] = read_prefixes(prefixes_tsv_path)
-    config["fields"] = read_fields(fields_tsv_path)
-    config["core"] = read_terms(core_tsv_path)
-    config["ab_controls"] = read_terms(ab_controls_tsv_path)
-    config["hosts"] = read_terms(hosts_tsv_path)
-    config["isotypes"] = read_terms(isotypes_tsv_path)
-    config["light_chains"] = read_terms(light_chain_tsv_path)
-    config["heavy_chain_germline"] = read_terms(heavy_chain_germline_tsv_path)
-    config["assays"] = read_terms(assays_tsv_path)
-    config["parameters"] = read_terms(parameters_tsv_path)
-    config["qualitative_measures"] = read_terms(qualitative_measures_tsv_path)
-    config["death_reason"] = read_terms(death_reason_tsv_path)
-    config["animal_model_strain"] = read_terms(animal_model_strain_tsv_path)
-    config["labels"] = read_labels(labels_tsv_path)
-    config["ids"] = read_ids(labels_tsv_path)
-
-    # Check for duplicates
-    term_sets = [
-        "core",
-        "ab_controls",
-        "hosts",
-        "isotypes",
-        "light_chains",
-        "heavy_chain_germline",
-        "assays",
-        "parameters",
-        "qualitative_measures",
-        "death_reason",
-        "animal_model_strain",
+    """Read TSV files and return a new config dictionary.
+    The config includes a "hashes" map of the content hash of the TSV file for each key.
+    Given a previous config with hashes, only re-read the TSV files that have changed."""
+    sources = [
+        ("prefixes", prefixes_tsv_path, read_prefixes),
+        ("fields", fields_tsv_path, read_fields),
+        ("core", core_tsv_path, read_terms),
+        ("ab_controls", ab_controls_tsv_path, read_terms),
+        ("hosts", hosts_tsv_path, read_terms),
+        ("isotypes", isotypes_tsv_path, read_terms),
+        ("light_chains", light_chain_tsv_path, read_terms),
+        ("heavy_chain_germline", heavy_chain_germline_tsv_path, read_terms),
+        ("assays", assays_tsv_path, read_terms),
+        ("parameters", parameters_tsv_path, read_terms),
+        ("qualitative_measures", qualitative_measures_tsv_path, read_terms),
+        ("death_reason", death_reason_tsv_path, read_terms),
+        ("animal_model_strain", animal_model_strain_tsv_path, read_terms),
+        ("labels", labels_tsv_path, read_labels),
+        ("ids", labels_tsv_path, read_ids),
     ]
-    ids = set()
-    labels = set()
-    for term_set in term_sets:
-        terms = config[term_set]
-        for label, term in terms.items():
-            id = term["id"]
-            if id in ids:
-                raise Exception(f"Duplicate ID '{id}' in term set '{term_set}'")
-            if label in labels:
-                raise Exception(f"Duplicate label '{label}' in term set '{term_set}'")
-            ids.add(id)
-            labels.add(label)
+    # When this builder code changes, everything is re-read.
+    hashes = {"config.py": hash_file(__file__)}
+    previous_hashes = {}
+    if previous and previous.get("hashes", {}).get("config.py") == hashes["config.py"]:
+        previous_hashes = previous["hashes"]
+
+    config = {}
+    changed = []
+    for key, path, reader in sources:
+        hashes[key] = hash_file(path)
+        if previous_hashes.get(key) == hashes[key] and key in previous:
+            config[key] = previous[key]
+        else:
+            config[key] = reader(path)
+            changed.append(key)
+    config["hashes"] = hashes
+
+    check_duplicates(config, changed)
+    config["columns"] = build_column_catalog(config)
 
     return config
 
@@ -254,51 +380,391 @@ def read(config_json_path="config.json"):
         raise Exception(f"Could not read config from '{config_json_path}': {e}")
 
 
-def load(config):
-    """Load a new config into the global dictionaries."""
-    global prefixes, core, ab_controls, hosts, isotypes, light_chains, heavy_chain_germline
-    global assays, parameters, qualitative_measures, death_reason, animal_model_strain
-    global fields, labels, ids
-    prefixes = config["prefixes"]
-    core = config["core"]
-    ab_controls = config["ab_controls"]
-    hosts = config["hosts"]
-    isotypes = config["isotypes"]
-    light_chains = config["light_chains"]
-    heavy_chain_germline = config["heavy_chain_germline"]
-    assays = config["assays"]
-    parameters = config["parameters"]
-    qualitative_measures = config["qualitative_measures"]
-    death_reason = config["death_reason"]
-    animal_model_strain = config["animal_model_strain"]
-    fields = config["fields"]
-    labels = config["labels"]
-    ids = config["ids"]
+# # Snapshots
+#
+# A snapshot is a compact binary form of a config.
+# The labels and IDs maps are stored as sorted string tables,
+# which can be searched in place in a read-only memory map,
+# so that all the worker processes on a server share one copy of them.
+# The other config dictionaries are small, and are stored with marshal.
+#
+# The file starts with the magic bytes and the offsets of three sections:
+# the marshalled config dictionaries, the labels table, and the IDs table.
+# Each table has a count N, then N + 1 key offsets and N + 1 value offsets,
+# then the keys and values as NUL-separated UTF-8 strings.
+
+SNAPSHOT_MAGIC = b"CVDBSNAP1\n"
+SNAPSHOT_HEADER = struct.Struct("<10sQQQQ")
+SNAPSHOT_MAPS = ["labels", "ids"]
+
+
+def pack_string_map(string_map):
+    """Given a map from strings to strings, return bytes for a sorted string table."""
+    items = sorted((k.encode("utf-8"), v.encode("utf-8")) for k, v in string_map.items())
+    offsets = []
+    for strings in [[k for k, v in items], [v for k, v in items]]:
+        offset = 0
+        for string in strings:
+            offsets.append(offset)
+            offset += len(string) + 1
+        offsets.append(offset)
+    keys = b"".join(k + b"\0" for k, v in items)
+    values = b"".join(v + b"\0" for k, v in items)
+    return struct.pack(f"<I{len(offsets)}I", len(items), *offsets) + keys + values
+
+
+class StringTable(Mapping):
+    """A read-only map from strings to strings,
+    read in place from a sorted string table in a buffer such as a memory map."""
+
+    def __init__(self, buffer, start):
+        self.buffer = buffer
+        (self.count,) = struct.unpack_from("<I", buffer, start)
+        self.key_offsets = start + 4
+        self.value_offsets = self.key_offsets + 4 * (self.count + 1)
+        self.keys_start = self.value_offsets + 4 * (self.count + 1)
+        (keys_length,) = struct.unpack_from("<I", buffer, self.key_offsets + 4 * self.count)
+        (self.values_length,) = struct.unpack_from("<I", buffer, self.keys_start - 4)
+        self.values_start = self.keys_start + keys_length
+
+    def get_string(self, offsets, start, i):
+        begin, end = struct.unpack_from("<II", self.buffer, offsets + 4 * i)
+        return bytes(self.buffer[start + begin : start + end - 1])
+
+    def get_key(self, i):
+        return self.get_string(self.key_offsets, self.keys_start, i)
+
+    def get_value(self, i):
+        return self.get_string(self.value_offsets, self.values_start, i)
+
+    def to_dict(self):
+        """Return all the keys and values as a new dictionary."""
+        if self.count == 0:
+            return {}
+        keys = bytes(self.buffer[self.keys_start : self.values_start])
+        values = bytes(self.buffer[self.values_start : self.values_start + self.values_length])
+        keys = keys.decode("utf-8")[:-1].split("\0")
+        values = values.decode("utf-8")[:-1].split("\0")
+        return dict(zip(keys, values))
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise KeyError(key)
+        target = key.encode("utf-8")
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            found = self.get_key(middle)
+            if found < target:
+                low = middle + 1
+            elif found > target:
+                high = middle
+            else:
+                return self.get_value(middle).decode("utf-8")
+        raise KeyError(key)
+
+    def __iter__(self):
+        for i in range(0, self.count):
+            yield self.get_key(i).decode("utf-8")
+
+    def __len__(self):
+        return self.count
+
+
+def to_plain(value):
+    """Given a config value, return it with OrderedDicts converted to dicts for marshal."""
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    return value
+
+
+def save_snapshot(config, output_path):
+    """Save a config dictionary to a binary snapshot file."""
+    rest = {k: to_plain(v) for k, v in config.items() if k not in SNAPSHOT_MAPS}
+    sections = [marshal.dumps(rest)]
+    for key in SNAPSHOT_MAPS:
+        sections.append(pack_string_map(config[key]))
+    offset = SNAPSHOT_HEADER.size
+    offsets = []
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    temp_path = output_path + ".tmp"
+    with open(temp_path, "wb") as output:
+        output.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, *offsets, offset))
+        for section in sections:
+            output.write(section)
+    os.replace(temp_path, output_path)
+
+
+def load_snapshot(snapshot_path, shared=False):
+    """Read a config dictionary from a binary snapshot file.
+    When shared is True, the labels and IDs maps are read in place
+    from a read-only memory map of the file, instead of being copied into dictionaries."""
+    with open(snapshot_path, "rb") as f:
+        if shared:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+    magic, rest_start, labels_start, ids_start, end = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise Exception(f"'{snapshot_path}' is not a config snapshot")
+    config = marshal.loads(buffer[rest_start:labels_start])
+    for key, start in zip(SNAPSHOT_MAPS, [labels_start, ids_start]):
+        table = StringTable(buffer, start)
+        config[key] = table if shared else table.to_dict()
+    return config
+
+
+# # Term Index
+#
+# The term index maps each term's ID, label, and normalized label
+# to the pair of its term set name and its term dictionary,
+# so that a value can be found in any term set with a single lookup.
 
 
-def update(config_json_path=None):
-    """Read and load a config."""
+def normalize_label(label):
+    """Given a label, return it in lower case with whitespace collapsed."""
+    return " ".join(label.split()).casefold()
+
+
+def build_term_index(config):
+    """Given a config dictionary, return the term index
+    and a map from term set names to frozensets of their labels."""
+    index = {}
+    normalized = {}
+    labels = {}
+    for term_set in term_sets:
+        terms = config[term_set]
+        labels[term_set] = frozenset(terms.keys())
+        for label, term in terms.items():
+            entry = (term_set, term)
+            index[term["id"]] = entry
+            index[label] = entry
+            normalized.setdefault(normalize_label(label), entry)
+    # IDs and exact labels take precedence over normalized labels
+    for key, entry in normalized.items():
+        index.setdefault(key, entry)
+    return index, labels
+
+
+def find_term(value):
+    """Given an ID or a label, return the pair of its term set name and term,
+    or (None, None) if it is not in any term set.
+    Labels that differ only in case or whitespace are also matched."""
+    index = get_state().term_index
+    if value in index:
+        return index[value]
+    return index.get(normalize_label(value), (None, None))
+
+
+def get_term_set(value):
+    """Given an ID or a label, return the name of its term set, or None."""
+    return find_term(value)[0]
+
+
+def get_term_labels(term_set):
+    """Given a term set name, return a frozenset of its labels."""
+    return get_state().term_labels[term_set]
+
+
+# # Column Catalog
+#
+# The column catalog maps each valid assay column name,
+# such as 'obi_0001643' or 'obi_0001643_normalized',
+# to its header dictionary.
+# It is built with the config, so resolving a column is a single lookup.
+# Column names that are not in the catalog are parsed with column_pattern
+# to explain what is wrong with them.
+
+column_pattern = re.compile(r"^(obi|ontie)_(\d+)(_.+)?$")
+column_suffixes = ["_stddev", "_normalized", "_qualitative", "_fold_change"]
+
+
+def get_column_name(term_id):
+    """Given an OBI or ONTIE term ID, return its column name, or None."""
+    prefix, _, local_id = term_id.partition(":")
+    if prefix not in ["OBI", "ONTIE"] or not local_id:
+        return None
+    return f"{prefix.lower()}_{local_id}"
+
+
+def make_column_header(term, suffix):
+    """Given an assay or parameter term and a column suffix,
+    return the header dictionary for that column, or None if the column is not valid."""
+    header = dict(term)
+    label = term["label"]
+    if suffix == "":
+        return header
+    header.pop("example", None)
+    if suffix == "_stddev":
+        if not term.get("units"):
+            return None
+        header["label"] = f"Standard deviation in {term['units']}"
+        header["description"] = f"The standard deviation of the value in '{label}'"
+    elif suffix == "_normalized":
+        header["label"] = f"{label} normalized value"
+        header["type"] = "score 0-1"
+        header["description"] = f"The normalized value for '{label}' from 0-1"
+    elif suffix == "_qualitative":
+        header["label"] = f"{label} qualitative value"
+        header["type"] = "text"
+        header["terminology"] = "qualitative_measures"
+        header["description"] = f"The qualitative value for '{label}'"
+    elif suffix == "_fold_change":
+        header["label"] = f"Fold-change {label}"
+        header["description"] = f"The fold-change of '{label}' over virus control"
+    return header
+
+
+def build_column_catalog(config):
+    """Given a config dictionary, return a map from every valid assay column name
+    to its header dictionary."""
+    catalog = {}
+    for term_set in ["assays", "parameters"]:
+        for term in config[term_set].values():
+            name = get_column_name(term["id"])
+            if not name or name in catalog:
+                continue
+            for suffix in [""] + column_suffixes:
+                header = make_column_header(term, suffix)
+                if header:
+                    catalog[name + suffix] = header
+    return catalog
+
+
+def get_column(column):
+    """Given a column name, return its shared header dictionary from the catalog, or None.
+    Copy the header before changing it."""
+    return get_state().columns.get(column)
+
+
+def parse_column(column):
+    """Given an assay column name, return the pair of its root term ID and its suffix,
+    or None if it does not look like an assay column."""
+    match = column_pattern.match(column)
+    if not match:
+        return None
+    prefix, local_id, suffix = match.groups()
+    return f"{prefix.upper()}:{local_id}", suffix or ""
+
+
+def load(config, path=None, stamp=None):
+    """Load a new config, replacing the current State in one step."""
+    global state
+    term_index, term_labels = build_term_index(config)
+    values = {key: config[key] for key in config_keys if key in config}
+    values.update(term_index=term_index, term_labels=term_labels)
+    if "columns" not in config:
+        values["columns"] = build_column_catalog(config)
+    with state_lock:
+        version = state.version + 1 if state else 1
+        state = State(version=version, path=path, stamp=stamp, **values)
+
+
+def get_config_path(config_json_path=None):
+    """Given an optional config path, return the path to load.
+    The path defaults to the CVDB_CONFIG environment variable, then the packaged config.json."""
+    if not config_json_path:
+        config_json_path = os.environ.get("CVDB_CONFIG")
     if not config_json_path:
         config_json_path = os.path.join(os.path.dirname(__file__), "config.json")
-    config = read(config_json_path)
+    return config_json_path
+
+
+def get_stamp(path):
+    """Given a path, return a pair of its modification time and size."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def update(config_json_path=None):
+    """Read and load a config.
+    The path defaults to the CVDB_CONFIG environment variable, then the packaged config.json.
+    A path ending in '.snapshot' is loaded as a shared snapshot."""
+    config_json_path = get_config_path(config_json_path)
+    stamp = get_stamp(config_json_path)
+    if config_json_path.endswith(".snapshot"):
+        config = load_snapshot(config_json_path, shared=True)
+    else:
+        config = read(config_json_path)
     result = validate(config)
     if result:
         raise Exception(f"Invalid config '{config_json_path}': {result}")
-    load(config)
+    load(config, config_json_path, stamp)
 
 
-def init():
+def reload(config_json_path=None):
+    """Read and validate a config, then swap it in for the current config.
+    If the new config is invalid, an exception is raised and the current config is kept.
+    Return the new State."""
+    update(config_json_path)
+    return state
+
+
+def reload_if_changed():
+    """Reload the current config if its file has changed since it was loaded.
+    Return True if it was reloaded."""
+    current = get_state()
+    if not current.path:
+        return False
+    try:
+        if get_stamp(current.path) == current.stamp:
+            return False
+    except FileNotFoundError:
+        return False
+    reload(current.path)
+    return True
+
+
+def watch(interval=5.0):
+    """Start a daemon thread that checks the config file every interval seconds
+    and reloads it when it changes.
+    Return a threading.Event: set it to stop watching."""
+    stopped = threading.Event()
+
+    def poll():
+        while not stopped.wait(interval):
+            try:
+                reload_if_changed()
+            except Exception as e:
+                print(
+                    f"Failed to reload config, keeping version {state.version}: {e}",
+                    file=sys.stderr,
+                )
+
+    threading.Thread(target=poll, name="cvdb-config-watch", daemon=True).start()
+    return stopped
+
+
+def init_repos():
     """Set the global data repositories."""
     global secret, staging, public
+    secret = None
+    staging = None
+    public = None
     if "CVDB_DATA" in os.environ:
         data_path = os.environ["CVDB_DATA"]
         if os.path.isdir(data_path):
             secret = Repo(os.path.join(data_path, "secret"))
             staging = Repo(os.path.join(data_path, "staging"))
             public = Repo(os.path.join(data_path, "public"))
+
+
+def init():
+    """Set the global data repositories and load the config."""
+    init_repos()
     update()
 
 
+def warm():
+    """Load the config and data repositories now, rather than on first access."""
+    init()
+
+
 def initialize():
     """Create the global data repositories."""
     if "CVDB_DATA" in os.environ:
@@ -330,9 +796,20 @@ def main():
     parser.add_argument("death_reason", type=str, help="The death_reason table")
     parser.add_argument("animal_model_strain", type=str, help="The animal_model_strain table")
     parser.add_argument("label", type=str, help="The label table")
-    parser.add_argument("output", type=str, help="The output JSON file")
+    parser.add_argument("output", type=str, help="The output JSON or .snapshot file")
     args = parser.parse_args()
 
+    # Reuse the term sets from the existing output when their TSV files have not changed
+    previous = None
+    if os.path.isfile(args.output):
+        try:
+            if args.output.endswith(".snapshot"):
+                previous = load_snapshot(args.output)
+            else:
+                previous = read(args.output)
+        except Exception:
+            previous = None
+
     config = build(
         args.prefix,
         args.field,
@@ -348,15 +825,16 @@ def main():
         args.death_reason,
         args.animal_model_strain,
         args.label,
+        previous=previous,
     )
     result = validate(config)
     if result:
         raise Exception(f"Invalid config: {result}")
-    save(config, args.output)
+    if args.output.endswith(".snapshot"):
+        save_snapshot(config, args.output)
+    else:
+        save(config, args.output)
 
 
 if __name__ == "__main__":
     main()
-else:
-    # Load config.json and data repositories
-    init()
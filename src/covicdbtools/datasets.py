@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import copy
+import csv
+import fcntl
+import json
 import os
 import re
 import shutil
+import sys
 import yaml
 
 from collections import OrderedDict
+from contextlib import contextmanager
 from git import Actor
 from io import BytesIO
 
@@ -21,6 +27,46 @@ from covicdbtools import (
 )
 from covicdbtools.responses import success, failure, failed
 
+# Use the libyaml C extension when it is available.
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+
+# # YAML
+#
+# Parsed YAML documents are cached for the life of the process,
+# keyed by path and the file's modification time and size,
+# so each file is only parsed again when it changes.
+# Readers get their own deep copy, which they are free to change.
+yaml_cache = {}
+
+
+def read_yaml(path):
+    """Given a path, return a copy of the parsed YAML document."""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = yaml_cache.get(path)
+    if cached and cached[0] == key:
+        return copy.deepcopy(cached[1])
+    with open(path, "r") as f:
+        document = yaml.load(f, Loader=YamlLoader)
+    yaml_cache[path] = (key, document)
+    return copy.deepcopy(document)
+
+
+def parse_yaml(value):
+    """Given a YAML string, return the parsed value."""
+    return yaml.load(value, Loader=YamlLoader)
+
+
+def write_yaml(document, path):
+    """Given a document of plain dicts, lists, and scalars, and a path,
+    write the document as YAML, keeping the order of keys."""
+    with open(path, "w") as outfile:
+        yaml.dump(document, outfile, Dumper=YamlDumper, sort_keys=False)
+
 
 def get_staging_path(dataset_id):
     """Given a dataset ID, return the path to its staging directory."""
@@ -31,71 +77,92 @@ def get_assay_header(column):
     """Given a column name that is an OBI or ONTIE ID
     (with an optional suffix for stddev, normalized, or qualitative),
     return the pair of a header dict and an error dict."""
-    header = None
-    assay_id = column.replace("obi_", "OBI:").replace("ontie_", "ONTIE:")
-    if assay_id in config.labels and config.labels[assay_id] in config.assays:
-        header = config.assays[config.labels[assay_id]].copy()
-    elif assay_id in config.labels and config.labels[assay_id] in config.parameters:
-        header = config.parameters[config.labels[assay_id]].copy()
+    header = config.get_column(column)
     if header:
-        return header, None
+        return header.copy(), None
 
-    root_id = (
-        assay_id.replace("_stddev", "")
-        .replace("_normalized", "")
-        .replace("_qualitative", "")
-        .replace("_fold_change", "")
-    )
-    if root_id not in config.labels:
+    parsed = config.parse_column(column)
+    if not parsed:
+        return None, failure(f"Unrecognized column '{column}'")
+    root_id, suffix = parsed
+    if config.get_term_set(root_id) not in ["assays", "parameters"]:
         return None, failure(f"Unrecognized assay '{root_id}' for column '{column}'")
-    root_label = config.labels[root_id]
+    if suffix not in config.column_suffixes:
+        return None, failure(f"Unrecognized assay suffix for column '{column}'")
+    return None, failure(f"Column '{column}' is not valid for assay '{root_id}'")
 
-    if root_label in config.assays:
-        header = config.assays[root_label].copy()
-    elif root_label in config.parameters:
-        header = config.parameters[root_label].copy()
-    else:
-        return None, failure(f"Unrecognized assay '{root_id}' for column '{column}'")
 
-    if column.endswith("_stddev"):
-        header["label"] = f"Standard deviation in {header['units']}"
-        header["description"] = f"The standard deviation of the value in '{root_label}'"
-        header.pop("example", None)
-    elif column.endswith("_normalized"):
-        header["label"] = f"{root_label} normalized value"
-        header["type"] = "score 0-1"
-        header["description"] = f"The normalized value for '{root_label}' from 0-1"
-        header.pop("example", None)
-    elif column.endswith("_qualitative"):
-        header["label"] = f"{root_label} qualitative value"
-        header["type"] = "text"
-        header["terminology"] = "qualitative_measures"
-        header["description"] = f"The qualitative value for '{root_label}'"
-        header.pop("example", None)
-    elif column.endswith("_fold_change"):
-        header["label"] = f"Fold-change {root_label}"
-        header["description"] = f"The fold-change of '{root_label}' over virus control"
-        header.pop("example", None)
-    else:
-        return None, failure(f"Unrecognized assay suffix for column '{column}'")
+class FrozenDict(dict):
+    """A dictionary that cannot be changed. Call copy() to get a plain dictionary."""
 
-    return header, None
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f"'{type(self).__name__}' object is immutable")
 
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
 
-def get_assay_headers(dataset_id):
-    """Given dataset ID, return the assay headers."""
-    dataset_path = get_staging_path(dataset_id)
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+def freeze(value):
+    """Given a value built from dicts and lists, return it as FrozenDicts and tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Given a value built from FrozenDicts and tuples, return a copy as dicts and lists."""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def get_dataset_yml_path(dataset_id):
+    """Given dataset ID, return the path to its dataset.yml file."""
     if dataset_id == "spr":
-        path = "examples/spr-dataset.yml"
+        return "examples/spr-dataset.yml"
     elif not config.staging:
         raise Exception("CVDB_STAGING directory is not configured")
-    else:
-        path = os.path.join(dataset_path, "dataset.yml")
+    return os.path.join(get_staging_path(dataset_id), "dataset.yml")
+
+
+# Assay headers are cached for each dataset,
+# keyed by the path, modification time, and size of its dataset.yml
+# and by the config version,
+# so that dataset.yml is only parsed again when it or the config changes.
+assay_headers_cache = {}
+
 
+def get_assay_headers(dataset_id):
+    """Given dataset ID, return the assay headers as a tuple of FrozenDicts,
+    or a failure response."""
+    path = get_dataset_yml_path(dataset_id)
     if not os.path.isfile(path):
         raise Exception(f"File does not exist '{path}'")
-    with open(path, "r") as f:
-        dataset = yaml.load(f, Loader=yaml.SafeLoader)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, config.get_state().version)
+    cached = assay_headers_cache.get(dataset_id)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    headers = read_assay_headers(path)
+    if isinstance(headers, dict):
+        return headers
+    headers = freeze(headers)
+    assay_headers_cache[dataset_id] = (key, headers)
+    return headers
+
+
+def read_assay_headers(path):
+    """Given the path to a dataset.yml file, return a list of assay headers
+    or a failure response."""
+    dataset = read_yaml(path)
     columns = dataset["Columns"]
 
     headers = []
@@ -131,10 +198,9 @@ def read_dataset_yml(dataset_id):
     """Given a dataset_id, return the dataset staging metadata."""
     path = os.path.join(get_staging_path(dataset_id), "dataset.yml")
     if os.path.isfile(path):
-        with open(path, "r") as f:
-            dataset = yaml.load(f, Loader=yaml.SafeLoader)
-            dataset["Columns"] = get_assay_headers(dataset_id)
-            return dataset
+        dataset = read_yaml(path)
+        dataset["Columns"] = thaw(get_assay_headers(dataset_id))
+        return dataset
     raise Exception(f"No dataset found for '{dataset_id}'")
 
 
@@ -154,7 +220,7 @@ def get_value(scope, dataset_id, key=None):
 def get_all_value(dataset_id, key=None):
     """Given a dataset ID and an optional key
     return the value or values from the all dataset metadata."""
-    secrets = get_secret_value(dataset_id, key)
+    secrets = get_secret_value(dataset_id)
     if key and key in secrets:
         return secrets[key]
     staging = get_staging_value(dataset_id, key)
@@ -166,20 +232,105 @@ def get_all_value(dataset_id, key=None):
     return None
 
 
+# # Secret Metadata
+#
+# The secret metadata for each dataset is stored in its own record file,
+# `datasets/{dataset_id}.yml` in the secret repository,
+# so that one dataset can be read and updated without touching the others.
+# The secret `datasets.tsv` is kept as an export of all the records for auditing,
+# and its rows are updated through a row index.
+# Datasets created before the record files existed are read from `datasets.tsv`.
+
+
+def get_secret_record_path(dataset_id):
+    """Given a dataset ID, return the path to its secret record file."""
+    return os.path.join(config.secret.working_tree_dir, "datasets", f"{dataset_id}.yml")
+
+
+def get_secret_index():
+    """Return the path to the secret `datasets.tsv`,
+    the path to its saved row index, and the current row index."""
+    path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
+    index_path = os.path.join(config.secret.git_dir, "covicdb", "datasets.tsv.json")
+    return path, index_path, tables.index_tsv(path, "ds_id", index_path)
+
+
+def read_secret_record(dataset_id):
+    """Given a dataset ID, return its secret metadata as an OrderedDict.
+    Keys that were added to `datasets.tsv` for other datasets have empty values."""
+    path = get_secret_record_path(dataset_id)
+    tsv_path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
+    if os.path.isfile(path):
+        record = read_yaml(path)
+        header = []
+        if os.path.isfile(tsv_path):
+            header = tables.read_tsv_header(tsv_path)
+        row = OrderedDict((key, record.get(key, "")) for key in header)
+        row.update(record)
+        return row
+    if os.path.isfile(tsv_path):
+        tsv_path, index_path, index = get_secret_index()
+        row = tables.read_indexed_row(tsv_path, index, str(dataset_id))
+        if row:
+            return row
+    raise Exception(f"No row found for dataset '{dataset_id}'")
+
+
+def write_secret_record(record):
+    """Given an OrderedDict of secret metadata with a "ds_id",
+    write its record file and update the secret `datasets.tsv` export.
+    Return the list of paths that were changed."""
+    path = get_secret_record_path(record["ds_id"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    write_yaml(dict(record), temp_path)
+    os.replace(temp_path, path)
+    return [path, export_secret_record(record)]
+
+
+def export_secret_record(record):
+    """Given an OrderedDict of secret metadata with a "ds_id",
+    add or replace its row in the secret `datasets.tsv`,
+    and return the path to that file.
+    Only a new key rewrites the whole file, adding a column to every row."""
+    path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        tables.append_tsv([OrderedDict(record)], path)
+        return path
+
+    path, index_path, index = get_secret_index()
+    header = index["header"]
+    if all(key in header for key in record):
+        row = OrderedDict((key, record.get(key, "")) for key in header)
+        if str(record["ds_id"]) in index["rows"]:
+            tables.replace_indexed_row(path, index, index_path, row)
+        else:
+            tables.append_tsv([row], path)
+        return path
+
+    rows = tables.read_tsv(path)
+    done = False
+    for row in rows:
+        if row["ds_id"] == str(record["ds_id"]):
+            row.update(record)
+            done = True
+    if not done:
+        rows.append(OrderedDict(record))
+    keys = list(header) + [key for key in record if key not in header]
+    rows = [OrderedDict((key, row.get(key)) for key in keys) for row in rows]
+    tables.write_tsv(rows, path)
+    return path
+
+
 def get_secret_value(dataset_id, key=None):
     """Given a dataset ID and an optional key
     return the value or values from the dataset secret metadata."""
     if key in ["ds_id"]:
         return failure(f"Key '{key}' cannot be updated")
-    path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
-    rows = tables.read_tsv(path)
-    for row in rows:
-        if row["ds_id"] == dataset_id:
-            if key:
-                return row[key]
-            else:
-                return row
-    raise Exception(f"No row found for dataset '{dataset_id}'")
+    row = read_secret_record(dataset_id)
+    if key:
+        return row[key]
+    return row
 
 
 def get_staging_value(dataset_id, key=None):
@@ -206,49 +357,87 @@ def set_value(scope, dataset_id, key, value):
         raise ValueError(f"Invalid scope '{scope}' for set_value")
 
 
+def set_values(scope, dataset_id, values):
+    """Given a scope (staging or secret), a dataset ID, and a dictionary of keys and values,
+    update the dataset metadata in one write
+    and commit the change in one commit."""
+    if not values:
+        return failure("No values to set")
+    if scope.casefold() == "secret":
+        repo = config.secret
+        paths = set_secret_values(dataset_id, values)
+    elif scope.casefold() == "staging":
+        repo = config.staging
+        paths = set_staging_values(dataset_id, values)
+    else:
+        raise ValueError(f"Invalid scope '{scope}' for set_values")
+    if isinstance(paths, dict):
+        return paths
+
+    keys = ", ".join(values.keys())
+    head = get_head(repo)
+    repo.index.add(paths)
+    repo.index.commit(
+        f"Set {keys} for dataset {dataset_id}", author=config.covic, committer=config.covic
+    )
+    if repo == config.staging:
+        update_catalog([dataset_id], head, committed=True)
+    return success({"dataset_id": dataset_id, "paths": paths})
+
+
 def set_secret_value(dataset_id, key, value):
     """Given a dataset ID, key, and value,
-    update the secret `datasets.tsv`."""
-    if key in ["ds_id"]:
-        return failure(f"Key '{key}' cannot be updated")
-    path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
-    rows = tables.read_tsv(path)
-    done = False
-    for row in rows:
-        if row["ds_id"] == dataset_id:
-            row[key] = str(value)
-            done = True
-        elif key not in row:
-            row[key] = None
-    if done:
-        tables.write_tsv(rows, path)
-    else:
-        raise Exception(f"No row found for dataset '{dataset_id}'")
+    update the secret metadata for the dataset."""
+    return set_secret_values(dataset_id, {key: value})
+
+
+def set_secret_values(dataset_id, values):
+    """Given a dataset ID and a dictionary of keys and values,
+    update the secret metadata for the dataset,
+    writing its record and the `datasets.tsv` export once for the whole batch.
+    Return the list of paths that were changed."""
+    for key in values:
+        if key in ["ds_id"]:
+            return failure(f"Key '{key}' cannot be updated")
+    record = read_secret_record(dataset_id)
+    for key, value in values.items():
+        record[key] = str(value)
+    return write_secret_record(record)
 
 
 def set_staging_value(dataset_id, key, value):
     """Given a dataset ID, a key string, and a value string,
     that can be represented in YAML,
     update the staging `dataset.yml` file."""
+    paths = set_staging_values(dataset_id, {key: value})
+    update_catalog([dataset_id])
+    return paths
+
+
+def set_staging_values(dataset_id, values):
+    """Given a dataset ID and a dictionary of keys and value strings
+    that can be represented in YAML,
+    update the staging `dataset.yml` file in one read and one write.
+    Return the list of paths that were changed."""
     if not config.staging:
         raise Exception("CVDB_STAGING directory is not configured")
     path = os.path.join(config.staging.working_tree_dir, "datasets", str(dataset_id), "dataset.yml")
-    parsed = yaml.load(value, Loader=yaml.SafeLoader)
-    with open(path, "r") as f:
-        dataset = yaml.load(f, Loader=yaml.SafeLoader)
-        dataset[key] = parsed
-        with open(path, "w") as outfile:
-            yaml.dump(dataset, outfile, sort_keys=False)
-
-
-def read_data(dataset_id):
-    """Read the metadata and data for a dataset."""
+    dataset = read_yaml(path)
+    for key, value in values.items():
+        dataset[key] = parse_yaml(value)
+    write_yaml(dataset, path)
+    return [path]
+
+
+def read_data(dataset_id, offset=0, limit=None, columns=None):
+    """Read the metadata and data for a dataset.
+    The "assays" are an iterator of rows, read from the TSV file as they are used.
+    Given an offset, a limit, and a list of columns,
+    only that page of assays is read, with only those columns."""
     dataset = read_dataset_yml(dataset_id)
 
     assays_tsv_path = os.path.join(get_staging_path(dataset_id), "assays.tsv")
-    assays = []
-    for row in tables.read_tsv(assays_tsv_path):
-        assays.append(row)
+    assays = tables.iter_tsv(assays_tsv_path, offset, limit, columns)
 
     return {"dataset": dataset, "assays": assays}
 
@@ -299,7 +488,7 @@ Columns:
             "title": "Dataset",
             "active": True,
             "activeCell": "A2",
-            "headers": [assay_headers],
+            "headers": [thaw(assay_headers)],
             "rows": [row[0 : len(assay_headers)] for row in rows],
         },
         terminology_grid,
@@ -311,7 +500,7 @@ def validate(assay_type, table):
     validate it and return a response with "grid" and maybe "errors",
     and an Excel file as "content"."""
     assay_headers = get_assay_headers(assay_type)
-    response = submissions.validate(assay_headers, table)
+    response = submissions.validate(thaw(assay_headers), table)
     grids = fill(assay_type, response["grid"]["rows"])
     content = BytesIO()
     workbooks.write(grids, content)
@@ -320,6 +509,218 @@ def validate(assay_type, table):
     return response
 
 
+@contextmanager
+def staging_lock():
+    """Hold an exclusive lock on a file in the staging git directory
+    while changing shared dataset files."""
+    lock_dir = os.path.join(config.staging.git_dir, "covicdb")
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, "datasets.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+# # Catalog
+#
+# The dataset catalog has one entry per staging dataset,
+# with its ID, status, columns, number of assay rows, and last commit,
+# so that datasets can be listed without reading every `dataset.yml`.
+# It is saved as JSON in the staging git directory,
+# along with the staging HEAD commit that it describes.
+# The functions that change datasets update the entries for those datasets,
+# keeping the row counts from the rows that they write,
+# and the other functions that commit to staging just advance the HEAD.
+# If the staging repository has changed in some other way,
+# the whole catalog is rebuilt from the dataset files.
+
+
+def get_catalog_path():
+    """Return the path to the dataset catalog."""
+    return os.path.join(config.staging.git_dir, "covicdb", "catalog.json")
+
+
+def get_head(repo):
+    """Given a git repository, return the SHA of its HEAD commit, or None."""
+    if not repo.head.is_valid():
+        return None
+    return repo.head.commit.hexsha
+
+
+def count_assays(path):
+    """Given the path to an assays TSV file, return the number of rows."""
+    if not os.path.isfile(path):
+        return 0
+    count = 0
+    with open(path, "r") as f:
+        reader = csv.reader(f, delimiter="\t")
+        next(reader, None)
+        for values in reader:
+            if values:
+                count += 1
+    return count
+
+
+def read_catalog_entry(dataset_id, commit=None, rows=None):
+    """Given a dataset ID and optionally its last commit SHA and number of assay rows,
+    read its files and return its catalog entry.
+    The assay rows are only counted when no number is given."""
+    dataset_path = get_staging_path(str(dataset_id))
+    dataset = read_yaml(os.path.join(dataset_path, "dataset.yml"))
+    if commit is None:
+        commit = config.staging.git.log("-1", "--format=%H", "--", dataset_path) or None
+    if rows is None:
+        rows = count_assays(os.path.join(dataset_path, "assays.tsv"))
+    return {
+        "ds_id": str(dataset_id),
+        "status": dataset.get("Dataset status"),
+        "columns": dataset.get("Columns") or [],
+        "rows": rows,
+        "commit": commit,
+    }
+
+
+def build_catalog():
+    """Read every staging dataset and return a new catalog."""
+    catalog = {"head": get_head(config.staging), "datasets": {}}
+    datasets_path = os.path.join(config.staging.working_tree_dir, "datasets")
+    if os.path.isdir(datasets_path):
+        with os.scandir(datasets_path) as entries:
+            for entry in entries:
+                if entry.is_dir() and re.fullmatch(r"\d+", entry.name):
+                    path = os.path.join(entry.path, "dataset.yml")
+                    if os.path.isfile(path):
+                        catalog["datasets"][entry.name] = read_catalog_entry(entry.name)
+    return catalog
+
+
+def save_catalog(catalog):
+    """Save the catalog, replacing the old file in one step."""
+    path = get_catalog_path()
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(catalog, f)
+    os.replace(temp_path, path)
+
+
+def read_saved_catalog(expected_heads=()):
+    """Return the saved catalog if it describes the current staging HEAD
+    or one of the expected HEAD commits, otherwise None."""
+    try:
+        with open(get_catalog_path(), "r") as f:
+            catalog = json.load(f)
+        if catalog["head"] == get_head(config.staging) or catalog["head"] in expected_heads:
+            return catalog
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def load_catalog(expected_heads=()):
+    """Return the saved catalog if it describes the current staging HEAD
+    or one of the expected HEAD commits, otherwise build and save a new catalog."""
+    catalog = read_saved_catalog(expected_heads)
+    if catalog is None:
+        catalog = build_catalog()
+        save_catalog(catalog)
+    return catalog
+
+
+def update_catalog(dataset_ids, previous_head=None, committed=False, rows=None, added_rows=None):
+    """Given a list of dataset IDs that have just changed,
+    the staging HEAD SHA from before the change,
+    whether the change was committed,
+    and optional dictionaries from dataset IDs to their new number of assay rows
+    and to the number of assay rows that were added,
+    update the catalog entries for just those datasets.
+    Other datasets keep their row counts, so assays are only counted for new entries.
+    Given no dataset IDs, just advance the catalog to the new staging HEAD.
+    The change has already been made, so a failure here does not undo it:
+    the saved catalog is removed, to be rebuilt when it is next loaded,
+    and a warning is printed."""
+    if not config.staging:
+        return
+    rows = rows or {}
+    added_rows = added_rows or {}
+    try:
+        with staging_lock():
+            catalog = read_saved_catalog([previous_head])
+            if catalog is None:
+                # A new catalog already describes the changed files
+                save_catalog(build_catalog())
+                return
+            head = get_head(config.staging)
+            for dataset_id in dataset_ids:
+                dataset_id = str(dataset_id)
+                entry = catalog["datasets"].get(dataset_id)
+                commit = None
+                if committed:
+                    commit = head
+                elif entry:
+                    commit = entry["commit"]
+                count = rows.get(dataset_id)
+                if count is None and entry:
+                    count = entry["rows"] + added_rows.get(dataset_id, 0)
+                catalog["datasets"][dataset_id] = read_catalog_entry(dataset_id, commit, count)
+            catalog["head"] = head
+            save_catalog(catalog)
+    except Exception as e:
+        try:
+            os.remove(get_catalog_path())
+        except OSError:
+            pass
+        print(f"Failed to update the dataset catalog, it will be rebuilt: {e}", file=sys.stderr)
+
+
+def list_datasets(filter=None):
+    """Given an optional filter dictionary, return a list of catalog entries.
+    The filter can have a "status" string and a "columns" list:
+    only datasets with that status and all those columns are returned."""
+    if not config.staging:
+        raise Exception("CVDB_STAGING directory is not configured")
+    filter = filter or {}
+    with staging_lock():
+        catalog = load_catalog()
+    results = []
+    for entry in sorted(catalog["datasets"].values(), key=lambda entry: int(entry["ds_id"])):
+        if "status" in filter and entry["status"] != filter["status"]:
+            continue
+        if "columns" in filter and not set(filter["columns"]).issubset(entry["columns"]):
+            continue
+        results.append(entry)
+    return results
+
+
+def scan_last_dataset_id(datasets_path):
+    """Given the staging datasets directory,
+    return the largest dataset ID among its top-level directories, or 0."""
+    last_id = 0
+    with os.scandir(datasets_path) as entries:
+        for entry in entries:
+            if entry.is_dir() and re.fullmatch(r"\d+", entry.name):
+                last_id = max(last_id, int(entry.name))
+    return last_id
+
+
+def allocate_dataset_id(datasets_path):
+    """Given the staging datasets directory, return a new dataset ID.
+    The last ID is stored in the 'last_id' file, which is committed with the new dataset.
+    If that file is missing, the top-level dataset directories are scanned instead.
+    A lock file in the staging git directory keeps concurrent calls from sharing an ID."""
+    last_id_path = os.path.join(datasets_path, "last_id")
+    with staging_lock():
+        if os.path.isfile(last_id_path):
+            with open(last_id_path) as f:
+                last_id = int(f.read().strip())
+        else:
+            last_id = scan_last_dataset_id(datasets_path)
+        dataset_id = last_id + 1
+        while os.path.exists(os.path.join(datasets_path, str(dataset_id))):
+            dataset_id += 1
+        with open(last_id_path, "w") as f:
+            f.write(f"{dataset_id}\n")
+    return dataset_id
+
+
 def create(name, email, columns=[]):
     if not config.staging:
         return failure("CVDB_STAGING directory is not configured")
@@ -327,53 +728,34 @@ def create(name, email, columns=[]):
     for column in columns:
         if column in config.fields:
             continue
-        if column.startswith("obi_") or column.startswith("ontie_"):
-            assay_id = column.replace("obi_", "OBI:").replace("ontie_", "ONTIE:")
-            root_id = (
-                assay_id.replace("_stddev", "")
-                .replace("_normalized", "")
-                .replace("_qualitative", "")
-                .replace("_fold_change", "")
-            )
-            if assay_id in config.labels:
-                continue
-            if root_id in config.labels:
-                if column.endswith("_stddev"):
-                    continue
-                if column.endswith("_normalized"):
-                    continue
-                if column.endswith("_qualitative"):
-                    continue
-                if column.endswith("_fold_change"):
-                    continue
+        if config.get_column(column):
+            continue
         return failure(f"Unrecognized column '{column}'")
 
     datasets_path = os.path.join(config.staging.working_tree_dir, "datasets")
-    current_id = 0
     if not os.path.exists(datasets_path):
         os.makedirs(datasets_path)
     if not os.path.isdir(datasets_path):
         return failure(f"'{datasets_path}' is not a directory")
-    for root, dirs, files in os.walk(datasets_path):
-        for name in dirs:
-            if re.match(r"\d+", name):
-                current_id = max(current_id, int(name))
-    dataset_id = current_id + 1
+    try:
+        dataset_id = allocate_dataset_id(datasets_path)
+    except Exception as e:
+        return failure("Failed to allocate a dataset ID", {"exception": e})
+    last_id_path = os.path.join(datasets_path, "last_id")
 
     author = Actor(name, email)
 
     # secret
     try:
-        path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
-        datasets = []
-        if os.path.isfile(path):
-            datasets = tables.read_tsv(path)
-        datasets.append(OrderedDict({"ds_id": dataset_id, "submitter_email": email}))
-        tables.write_tsv(datasets, path)
+        record = OrderedDict({"ds_id": str(dataset_id), "submitter_email": email})
+        paths = write_secret_record(record)
     except Exception as e:
-        return failure(f"Failed to update '{path}'", {"exception": e})
+        return failure(
+            f"Failed to update secret metadata for dataset {dataset_id}", {"exception": e}
+        )
     try:
-        config.secret.index.add([path])
+        path = paths[0]
+        config.secret.index.add(paths)
         config.secret.index.commit(
             f"Create dataset {dataset_id}", author=author, committer=config.covic
         )
@@ -393,51 +775,105 @@ def create(name, email, columns=[]):
             "Columns": columns,
         }
         path = os.path.join(dataset_path, "dataset.yml")
-        with open(path, "w") as outfile:
-            yaml.dump(dataset, outfile, sort_keys=False)
+        write_yaml(dataset, path)
     except Exception as e:
         return failure(f"Failed to write '{path}'", {"exception": e})
     try:
-        config.staging.index.add([path])
+        head = get_head(config.staging)
+        config.staging.index.add([path, last_id_path])
         config.staging.index.commit(
             f"Create dataset {dataset_id}", author=author, committer=config.covic
         )
     except Exception as e:
         return failure(f"Failed to commit '{path}'", {"exception": e})
+    update_catalog([dataset_id], head, committed=True, rows={str(dataset_id): 0})
 
     print(f"Created dataset {dataset_id}")
     return success({"dataset_id": dataset_id})
 
 
-def submit(name, email, dataset_id, table):
-    """Given a dataset ID and a new table of assays,
-    validate it, save it to staging, and commit."""
+submit_modes = ["replace", "append", "upsert"]
+
+
+def get_replicate_key(dataset_id):
+    """Given a dataset ID, return the list of columns that identify an assay row:
+    'ab_id' followed by the columns in the optional 'Replicate key' of its dataset.yml."""
+    dataset = read_yaml(get_dataset_yml_path(dataset_id))
+    replicate_key = dataset.get("Replicate key") or []
+    if isinstance(replicate_key, str):
+        replicate_key = [replicate_key]
+    return ["ab_id"] + [column for column in replicate_key if column != "ab_id"]
+
+
+def validate_replicate_key(dataset_id, table):
+    """Given a dataset ID and a submission table,
+    check that the replicate key columns are columns of the dataset
+    and that no two rows of the table have the same replicate key.
+    Return a list of errors."""
+    replicate_key = get_replicate_key(dataset_id)
+    labels = {}
+    for header in get_assay_headers(dataset_id):
+        value = "ab_id" if header["value"] == "ab_label" else header["value"]
+        labels[value] = header["label"]
+    missing = [column for column in replicate_key if column not in labels]
+    if missing:
+        return [f"Replicate key columns are not in the dataset: {', '.join(missing)}"]
+
+    errors = []
+    seen = {}
+    for i in range(0, len(table)):
+        row = table[i]
+        if "".join(str(value).strip() for value in row.values()) == "":
+            continue
+        value = tuple(str(row.get(labels[column], "")).strip() for column in replicate_key)
+        if value in seen:
+            errors.append(
+                "Error in row {0}: Duplicate replicate key '{1}', also in row {2}".format(
+                    i + 2, ", ".join(value), seen[value]
+                )
+            )
+        else:
+            seen[value] = i + 2
+    return errors
+
+
+def submit(name, email, dataset_id, table, mode="replace"):
+    """Given a dataset ID, a new table of assays, and a mode,
+    validate it, save it to staging, and commit.
+    The mode "replace" overwrites the assays,
+    "append" adds the new rows to the end,
+    and "upsert" replaces rows that have the same replicate key and appends the others.
+    Only the new rows are validated."""
+    if mode not in submit_modes:
+        return failure(f"Invalid submit mode '{mode}', must be one of {', '.join(submit_modes)}")
     response = validate(dataset_id, table)
+    if mode == "upsert":
+        errors = validate_replicate_key(dataset_id, table)
+        if errors:
+            response["errors"] = response.get("errors", []) + errors
+            response = failure(f"There were {len(response['errors'])} errors", response)
     if failed(response):
         return response
     table = response["table"]  # remove blank rows
 
-    ab_ids = {}
-    for ab in config.read_blinded_antibodies():
-        ab_id = ab["ab_id"]
-        ab_label = ab_id.replace(":", "-")
-        ab_ids[ab_label] = ab_id
+    ab_ids = dict(config.get_blinded_antibodies()["ids_by_label"])
     for row in config.ab_controls.values():
         ab_ids[row["label"]] = row["id"]
 
     assay_headers = get_assay_headers(dataset_id)
-    assays = []
-    for row in table:
-        assay = OrderedDict()
-        for header in assay_headers:
-            value = header["value"]
-            label = header["label"]
-            if value == "ab_label":
-                row[label] = row[label].strip()
-                assay["ab_id"] = ab_ids[row[label]]
-            else:
-                assay[value] = row[label]
-        assays.append(assay)
+
+    def assays():
+        for row in table:
+            assay = OrderedDict()
+            for header in assay_headers:
+                value = header["value"]
+                label = header["label"]
+                if value == "ab_label":
+                    row[label] = row[label].strip()
+                    assay["ab_id"] = ab_ids[row[label]]
+                else:
+                    assay[value] = row[label]
+            yield assay
 
     author = Actor(name, email)
 
@@ -446,27 +882,40 @@ def submit(name, email, dataset_id, table):
         return failure("CVDB_STAGING directory is not configured")
     dataset_path = os.path.join(config.staging.working_tree_dir, "datasets", str(dataset_id))
     paths = []
-    try:
-        set_staging_value(dataset_id, "Dataset status", "submitted")
-        path = os.path.join(dataset_path, "dataset.yml")
-        paths.append(path)
-    except Exception as e:
-        return failure("Failed to update dataset status", {"exception": e})
+    # Write the assays first, so that nothing changes when they cannot be written
     try:
         path = os.path.join(dataset_path, "assays.tsv")
-        tables.write_tsv(assays, path)
+        rows = {}
+        added_rows = {}
+        if mode == "append":
+            count = tables.append_tsv(assays(), path)
+            added_rows[str(dataset_id)] = count
+            message = f"Append {count} assays to dataset {dataset_id}"
+        elif mode == "upsert":
+            replaced, appended = tables.upsert_tsv(assays(), path, get_replicate_key(dataset_id))
+            added_rows[str(dataset_id)] = appended
+            message = f"Update {replaced} and add {appended} assays in dataset {dataset_id}"
+        else:
+            rows[str(dataset_id)] = tables.write_tsv_stream(assays(), path)
+            message = f"Submit assays to dataset {dataset_id}"
         paths.append(path)
     except Exception as e:
         return failure(f"Failed to write '{path}'", {"exception": e})
     try:
+        paths += set_staging_values(dataset_id, {"Dataset status": "submitted"})
+    except Exception as e:
+        return failure("Failed to update dataset status", {"exception": e})
+    try:
+        head = get_head(config.staging)
         config.staging.index.add(paths)
         config.staging.index.commit(
-            f"Submit assays to dataset {dataset_id}",
+            message,
             author=author,
             committer=config.covic,
         )
     except Exception as e:
         return failure(f"Failed to commit '{path}'", {"exception": e})
+    update_catalog([dataset_id], head, committed=True, rows=rows, added_rows=added_rows)
 
     grid = grids.table_to_grid(config.prefixes, config.fields, table)
     print(f"Submitted assays to dataset {dataset_id}")
@@ -474,56 +923,87 @@ def submit(name, email, dataset_id, table):
 
 
 def promote(name, email, dataset_id):
-    author = Actor(name, email)
+    """Given the promoter's name and email and a dataset ID,
+    promote the dataset from staging to public."""
+    response = promote_datasets(name, email, [dataset_id])
+    if failed(response):
+        return response
+    return success({"dataset_id": dataset_id})
 
-    # staging
+
+def promote_datasets(name, email, dataset_ids):
+    """Given the promoter's name and email and a list of dataset IDs,
+    check all the datasets first, then promote them from staging to public
+    with one staging commit and one public commit."""
+    author = Actor(name, email)
     if not config.staging:
         return failure("CVDB_STAGING directory is not configured")
-    staging_dataset_path = os.path.join(
-        config.staging.working_tree_dir, "datasets", str(dataset_id)
-    )
+    if not config.public:
+        return failure("CVDB_PUBLIC directory is not configured")
+    dataset_ids = [str(dataset_id) for dataset_id in dataset_ids]
+    if not dataset_ids:
+        return failure("No datasets to promote")
+    if len(set(dataset_ids)) < len(dataset_ids):
+        return failure(f"Duplicate dataset IDs in {', '.join(dataset_ids)}")
+
+    filenames = ["dataset.yml", "assays.tsv"]
+    staging_datasets_path = os.path.join(config.staging.working_tree_dir, "datasets")
+    public_datasets_path = os.path.join(config.public.working_tree_dir, "datasets")
+    errors = []
+    for dataset_id in dataset_ids:
+        for filename in filenames:
+            path = os.path.join(staging_datasets_path, dataset_id, filename)
+            if not os.path.isfile(path):
+                errors.append(f"File does not exist '{path}'")
+        path = os.path.join(public_datasets_path, dataset_id)
+        if os.path.exists(path):
+            errors.append(f"Dataset {dataset_id} has already been promoted to '{path}'")
+    if errors:
+        return failure(f"There were {len(errors)} errors", {"errors": errors})
+
+    if len(dataset_ids) == 1:
+        message = f"Promote dataset {dataset_ids[0]}"
+    else:
+        message = f"Promote {len(dataset_ids)} datasets\n\nDatasets: {', '.join(dataset_ids)}"
+
+    # staging
     paths = []
     try:
-        set_staging_value(dataset_id, "Dataset status", "promoted")
-        path = os.path.join(staging_dataset_path, "dataset.yml")
-        paths.append(path)
+        for dataset_id in dataset_ids:
+            paths += set_staging_values(dataset_id, {"Dataset status": "promoted"})
     except Exception as e:
         return failure("Failed to update dataset status", {"exception": e})
     try:
+        head = get_head(config.staging)
         config.staging.index.add(paths)
-        config.staging.index.commit(
-            f"Promote dataset {dataset_id}", author=author, committer=config.covic
-        )
+        config.staging.index.commit(message, author=author, committer=config.covic)
     except Exception as e:
-        return failure(f"Failed to commit '{path}'", {"exception": e})
+        return failure("Failed to commit staging datasets", {"exception": e})
+    update_catalog(dataset_ids, head, committed=True)
 
     # public
-    if not config.public:
-        return failure("CVDB_PUBLIC directory is not configured")
-    public_dataset_path = os.path.join(config.public.working_tree_dir, "datasets", str(dataset_id))
-    try:
-        os.makedirs(public_dataset_path)
-    except Exception as e:
-        return failure(f"Could not create '{path}'", {"exception": e})
+    paths = []
     try:
-        paths = []
-        for filename in ["dataset.yml", "assays.tsv"]:
-            src = os.path.join(staging_dataset_path, filename)
-            dst = os.path.join(public_dataset_path, filename)
-            shutil.copyfile(src, dst)
-            paths.append(dst)
+        for dataset_id in dataset_ids:
+            os.makedirs(os.path.join(public_datasets_path, dataset_id))
+            for filename in filenames:
+                src = os.path.join(staging_datasets_path, dataset_id, filename)
+                dst = os.path.join(public_datasets_path, dataset_id, filename)
+                shutil.copyfile(src, dst)
+                paths.append(dst)
     except Exception as e:
-        return failure(f"Could not copy '{src}' to '{dst}'", {"exception": e})
+        return failure("Could not copy datasets to public", {"exception": e})
     try:
         config.public.index.add(paths)
-        config.public.index.commit(
-            f"Promote dataset {dataset_id}", author=config.covic, committer=config.covic
-        )
+        config.public.index.commit(message, author=config.covic, committer=config.covic)
     except Exception as e:
-        return failure(f"Failed to commit '{public_dataset_path}'", {"exception": e})
+        return failure("Failed to commit public datasets", {"exception": e})
 
-    print(f"Promoted dataset {dataset_id} from staging to public")
-    return success({"dataset_id": dataset_id})
+    if len(dataset_ids) == 1:
+        print(f"Promoted dataset {dataset_ids[0]} from staging to public")
+    else:
+        print(f"Promoted datasets {', '.join(dataset_ids)} from staging to public")
+    return success({"dataset_ids": dataset_ids})
 
 
 if __name__ == "__main__":
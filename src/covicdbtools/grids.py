@@ -7,6 +7,8 @@
 
 import json
 
+from itertools import chain
+
 from covicdbtools import names, config
 
 
@@ -114,14 +116,19 @@ def is_grid(grid):
 
 def table_to_grid(prefixes, fields, table):
     """Given the prefixes map, fields map, and a (probably labelled) table,
-    return a grid."""
+    return a grid.
+    The table can also be an iterator of rows, such as from tables.iter_tsv()."""
     grid = {}
+    table = iter(table)
+    first = next(table, None)
+    if first is None:
+        raise IndexError("Cannot make a grid from an empty table")
 
     headers = []
-    for key in table[0].keys():
+    for key in first.keys():
         if not isinstance(key, str):
-            raise Exception(f"Bad key '{key}' in table '{table[0]}'")
-        if not (key.endswith("_label") and names.label_key_to_id_key(key) in table[0]):
+            raise Exception(f"Bad key '{key}' in table '{first}'")
+        if not (key.endswith("_label") and names.label_key_to_id_key(key) in first):
             label = key
             if key in fields:
                 label = fields[key]["label"]
@@ -129,7 +136,7 @@ def table_to_grid(prefixes, fields, table):
     grid["headers"] = [headers]
 
     rows = []
-    for row in table:
+    for row in chain([first], table):
         newrow = []
         for key, value in row.items():
             cell = None
@@ -132,6 +132,8 @@ def label_table(labels, table):
     """Given the labels map and a table,
     look for _id keys and insert _label key-value pairs
     then return the new table."""
+    if isinstance(table, tables.Table):
+        return label_columns(labels, table)
     newtable = []
     for row in table:
         newrow = OrderedDict()
@@ -144,9 +146,69 @@ def label_table(labels, table):
                 else:
                     newrow[label_key] = ""
         newtable.append(newrow)
+    if isinstance(table, tables.ValidTable) and newtable:
+        # Every new row has the same keys, so the new table is also valid
+        return tables.ValidTable(newtable, newtable[0].keys())
     return newtable
 
 
+def label_columns(labels, table):
+    """Given the labels map and a Table,
+    insert a _label column after each _id column
+    then return the new Table."""
+    header = []
+    columns = []
+    for key, column in zip(table.header, table.columns):
+        header.append(key)
+        columns.append(column)
+        label_key = id_key_to_label_key(key)
+        if key.endswith("_id") and label_key not in table.positions:
+            header.append(label_key)
+            if isinstance(column, tables.Categorical):
+                # Look up each distinct ID just once
+                columns.append(column.map(lambda value: labels.get(value, "")))
+            else:
+                columns.append([labels.get(value, "") for value in column])
+    return tables.Table(header, columns, table.validated)
+
+
+# # Categories
+#
+# Antibody and assay tables repeat a few terms across many rows.
+# In a columnar Table these columns can be dictionary encoded,
+# with codes taken from the order of the config term sets.
+
+
+def get_categories():
+    """Return a map from column keys to the list of expected values in that column."""
+    categories = {"qualitative_measure": list(config.qualitative_measures.keys())}
+    term_sets = {
+        "host": config.hosts,
+        "isotype": config.isotypes,
+        "light_chain": config.light_chains,
+        "heavy_chain_germline": config.heavy_chain_germline,
+    }
+    for name, terms in term_sets.items():
+        categories[f"{name}_id"] = [term["id"] for term in terms.values()]
+        categories[f"{name}_label"] = list(terms.keys())
+    return categories
+
+
+def encode_table(table):
+    """Given a columnar Table, dictionary encode its categorical columns in place:
+    the term columns, the qualitative measure columns, and the antibody IDs.
+    Return the Table."""
+    categories = get_categories()
+    for key in table.header:
+        if key in categories:
+            table.encode(key, categories[key])
+        elif key.endswith("_qualitative"):
+            table.encode(key, categories["qualitative_measure"])
+        elif key in ["ab_id", "ab_label"]:
+            table.encode(key)
+    return table
+
+
 def label_tsv(labels, tsv_path):
     """Read a TSV table and then label it."""
     return label_table(labels, tables.read_tsv(tsv_path))
@@ -179,20 +179,19 @@ def validate(headers, table):
     errors = []
     rows = []
     unique = defaultdict(set)
-    blinded_antibodies = config.read_blinded_antibodies()
-    ab_ids = [x["ab_id"] for x in blinded_antibodies] + [
-        x["id"] for x in config.ab_controls.values()
-    ]
-    ab_labels = [x["ab_id"].replace(":", "-") for x in blinded_antibodies] + list(
-        config.ab_controls.keys()
-    )
+    blinded_antibodies = config.get_blinded_antibodies()
+    ab_ids = blinded_antibodies["ab_ids"] | {x["id"] for x in config.ab_controls.values()}
+    ab_labels = blinded_antibodies["ab_labels"] | set(config.ab_controls.keys())
 
     columns = set()
+    terminologies = {}
     for header in headers:
         try:
             columns.add(header["label"])
         except KeyError as e:
             raise Exception(f"Bad header {header}", e)
+        if "terminology" in header:
+            terminologies[header["label"]] = frozenset(header["terminology"])
 
     new_table = []
     for i in range(0, len(table)):
@@ -243,7 +242,7 @@ def validate(headers, table):
                 error = f"Missing required value in column '{column}'"
             elif "unique" in header and header["unique"] and value in unique[column]:
                 error = f"Duplicate value '{value}' is not allowed in column '{column}'"
-            elif "terminology" in header and value != "" and value not in header["terminology"]:
+            elif column in terminologies and value != "" and value not in terminologies[column]:
                 error = f"'{value}' is not a valid term in column '{column}'"
             elif "type" in header and value != "":
                 error = validate_field(column, header["type"], value)
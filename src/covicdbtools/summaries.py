@@ -11,7 +11,7 @@ def read_data(
     dataset_path,
 ):
     # ab_list = antibodies.read_antibodies(config.labels, antibodies_tsv_path)
-    ab_table = tables.read_tsv(antibodies_tsv_path)
+    ab_table = tables.iter_tsv(antibodies_tsv_path)
     grid = grids.table_to_grid(config.prefixes, config.fields, ab_table)
     cell = grids.value_cell("")
     cell["colspan"] = len(grid["headers"][0])
@@ -24,9 +24,9 @@ def read_data(
             if name.endswith("-valid-expanded.tsv"):
                 assays_tsv_path = os.path.join(root, name)
                 assay_name = name.replace("-submission-valid-expanded.tsv", "").replace("-", " ")
-                assay_table = tables.read_tsv(assays_tsv_path)
-                columns = len(assay_table[0].keys()) - 1
+                assay_table = tables.iter_tsv(assays_tsv_path)
                 assay_grid = grids.table_to_grid(config.prefixes, config.fields, assay_table)
+                columns = len(assay_grid["headers"][0]) - 1
 
                 ab_map = {}
                 for row in assay_grid["rows"]:
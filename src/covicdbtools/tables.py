@@ -3,26 +3,290 @@
 # In this project a "table" is represented by a list
 # of OrderedDicts with the same keys and string values,
 # and stored as a TSV file.
+# Large tables can also be represented by a columnar Table,
+# with a tuple of keys and one list of string values per column.
+# Columns that repeat a few values can be dictionary encoded as Categorical columns.
 
 import csv
+import hashlib
 import io
+import json
+import os
+import pickle
 
+from array import array
 from collections import OrderedDict
-from tabulate import tabulate
+from itertools import islice
 
 
 # # Tables
+#
+# Validating a large table means checking every value,
+# so the tables that our own readers build are marked as valid:
+# a ValidTable is a list of OrderedDicts that records its header,
+# and a Table records whether its values have been validated.
+# Callers that change a marked table in place are responsible for keeping it valid.
 
+QUICK_SAMPLE_SIZE = 100
 
-def validate_table(table):
-    """Given a table, return None if it is valid,
+# When this is set to a directory, parsed TSV files are cached there.
+cache_dir = os.environ.get("CVDB_CACHE")
+
+
+class Categorical:
+    """A dictionary encoded column: an array of integer codes
+    and a list of the distinct values that the codes refer to.
+    It can be used wherever a list of values is expected."""
+
+    def __init__(self, values=(), vocabulary=()):
+        self.values = []
+        self.codes_by_value = {}
+        self.codes = array("H")
+        for value in vocabulary:
+            self.encode(value)
+        for value in values:
+            self.append(value)
+
+    def encode(self, value):
+        """Given a value, return its code, adding it to the vocabulary if it is new."""
+        code = self.codes_by_value.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > 0xFFFF and self.codes.typecode == "H":
+                self.codes = array("I", self.codes)
+            self.values.append(value)
+            self.codes_by_value[value] = code
+        return code
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def copy(self):
+        column = Categorical()
+        column.values = list(self.values)
+        column.codes_by_value = dict(self.codes_by_value)
+        column.codes = array(self.codes.typecode, self.codes)
+        return column
+
+    def map(self, function):
+        """Given a function of one value, return a new Categorical column
+        with the same codes, applying the function once to each distinct value."""
+        column = Categorical()
+        codes = [column.encode(function(value)) for value in self.values]
+        column.codes = array(self.codes.typecode, [codes[code] for code in self.codes])
+        return column
+
+    def indexes(self, value):
+        """Given a value, return the list of positions that have that value,
+        comparing integer codes rather than values."""
+        code = self.codes_by_value.get(value)
+        if code is None:
+            return []
+        return [i for i, c in enumerate(self.codes) if c == code]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        values = self.values
+        for code in self.codes:
+            yield values[code]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            column = self.copy()
+            column.codes = column.codes[i]
+            return column
+        return self.values[self.codes[i]]
+
+    def __eq__(self, other):
+        if isinstance(other, (Categorical, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Categorical({len(self.values)} values, {len(self)} rows)"
+
+
+class Table:
+    """A columnar table: a header tuple of keys and one list of values per column.
+    Rows are built as OrderedDicts only when they are requested,
+    so a Table can be used wherever a list of OrderedDicts is expected.
+    The given columns are copied, unless copy is False,
+    in which case the new Table shares those column lists."""
+
+    def __init__(self, header=(), columns=None, validated=False, copy=True):
+        self.header = tuple(header)
+        self.validated = validated
+        if columns is None:
+            columns = [[] for key in self.header]
+        elif copy:
+            columns = [
+                column.copy() if isinstance(column, Categorical) else list(column)
+                for column in columns
+            ]
+        self.columns = list(columns)
+        if len(self.columns) != len(self.header):
+            raise Exception(f"Table has {len(self.header)} keys but {len(self.columns)} columns")
+        self.positions = {key: i for i, key in enumerate(self.header)}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Given a list of OrderedDicts, return a new Table."""
+        if isinstance(rows, Table):
+            return rows
+        table = None
+        for row in rows:
+            if table is None:
+                table = cls(row.keys())
+            table.append(row)
+        if table is None:
+            return cls()
+        return table
+
+    def to_rows(self):
+        """Return this table as a list of OrderedDicts."""
+        return list(self)
+
+    def column(self, key):
+        """Given a key, return the list of values for that column."""
+        return self.columns[self.positions[key]]
+
+    def encode(self, key, vocabulary=()):
+        """Given a key and an optional list of expected values,
+        replace that column with a dictionary encoded Categorical column."""
+        position = self.positions[key]
+        column = self.columns[position]
+        if not isinstance(column, Categorical):
+            self.columns[position] = Categorical(column, vocabulary)
+
+    def select(self, key, value):
+        """Given a key and a value, return a new Table with just the rows with that value."""
+        column = self.column(key)
+        if isinstance(column, Categorical):
+            indexes = column.indexes(value)
+        else:
+            indexes = [i for i, v in enumerate(column) if v == value]
+        columns = []
+        for column in self.columns:
+            if isinstance(column, Categorical):
+                selected = column.copy()
+                selected.codes = array(column.codes.typecode, [column.codes[i] for i in indexes])
+            else:
+                selected = [column[i] for i in indexes]
+            columns.append(selected)
+        return Table(self.header, columns, self.validated, copy=False)
+
+    def row(self, i):
+        """Given a row index, return a new OrderedDict for that row."""
+        return OrderedDict(zip(self.header, [column[i] for column in self.columns]))
+
+    def append(self, row):
+        """Given an OrderedDict or a list of values, append it as a new row."""
+        if isinstance(row, dict):
+            if list(row.keys()) != list(self.header):
+                raise Exception(f"Row keys {list(row.keys())} do not match {list(self.header)}")
+            row = row.values()
+        values = list(row)
+        if len(values) != len(self.header):
+            raise Exception(f"Row has {len(values)} values but table has {len(self.header)} keys")
+        for column, value in zip(self.columns, values):
+            column.append(value)
+            if type(value) is not str:
+                self.validated = False
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(self.columns[0])
+
+    def __iter__(self):
+        for values in zip(*self.columns):
+            yield OrderedDict(zip(self.header, values))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            columns = [column[i] for column in self.columns]
+            return Table(self.header, columns, self.validated, copy=False)
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("Table row index out of range")
+        return self.row(i)
+
+    def __eq__(self, other):
+        if isinstance(other, Table):
+            return self.header == other.header and self.columns == other.columns
+        if isinstance(other, list):
+            return self.to_rows() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Table({list(self.header)}, {len(self)} rows)"
+
+
+class ValidTable(list):
+    """A list of OrderedDicts that is known to be a valid table,
+    with a header tuple of the keys for every row."""
+
+    def __init__(self, rows=(), header=()):
+        super().__init__(rows)
+        self.header = tuple(header)
+
+
+def sample_indexes(length, quick=False):
+    """Given a table length, return the row indexes to check:
+    all of them, or when quick is True an evenly spaced sample including the last row."""
+    if not quick or length <= QUICK_SAMPLE_SIZE:
+        return range(0, length)
+    step = length // QUICK_SAMPLE_SIZE
+    return list(range(0, length, step)) + [length - 1]
+
+
+def validate_columns(table, quick=False):
+    """Given a Table, return None if it is valid,
     otherwise return a message string."""
-    if type(table) is not list:
+    for key in table.header:
+        if type(key) is not str:
+            return f"Key '{key}' is not a string"
+    length = len(table)
+    for key, column in zip(table.header, table.columns):
+        if len(column) != length:
+            return f"Column '{key}' has {len(column)} values but table has {length} rows"
+    if table.validated:
+        return None
+    indexes = sample_indexes(length, quick)
+    for key, column in zip(table.header, table.columns):
+        if isinstance(column, Categorical):
+            for value in column.values:
+                if type(value) is not str:
+                    return f"In column '{key}' the value '{value}' is not a string"
+            continue
+        for i in indexes:
+            value = column[i]
+            if type(value) is not str:
+                return "In row {0} key '{1}' the value '{2}' is not a string".format(i, key, value)
+    return None
+
+
+def validate_table(table, quick=False):
+    """Given a table, return None if it is valid,
+    otherwise return a message string.
+    Tables marked as valid are only checked at their first and last rows.
+    When quick is True, only check a sample of rows."""
+    if isinstance(table, Table):
+        return validate_columns(table, quick)
+    if type(table) is not list and type(table) is not ValidTable:
         return "Input is not a list"
     if len(table) < 1:
         return None
     keys = table[0].keys()
-    for i in range(0, len(table)):
+    indexes = sample_indexes(len(table), quick)
+    if type(table) is ValidTable:
+        indexes = [0, len(table) - 1]
+        if tuple(keys) != table.header:
+            return "Keys for row 0 do not match the table header"
+    for i in indexes:
         row = table[i]
         if type(row) is not OrderedDict:
             return "Row {0} is not an OrderedDict".format(i)
@@ -34,12 +298,13 @@ def validate_table(table):
     return None
 
 
-def is_table(table):
+def is_table(table, quick=False):
     """Given a table, return True if
     it is a list with length greater than 1
     and all rows are OrderedDicts with the same keys.
-    Return False otherwise."""
-    if validate_table(table):
+    Return False otherwise.
+    When quick is True, only check a sample of rows."""
+    if validate_table(table, quick):
         return False
     return True
 
@@ -47,16 +312,214 @@ def is_table(table):
 # # Reading and Writing
 
 
-def read_tsv(path):
+def read_tsv(path, columnar=False):
     """Given a path, read a TSV file
-    and return a list of OrderedDicts."""
+    and return a list of OrderedDicts,
+    or a Table when columnar is True."""
+    if cache_dir:
+        table = read_cached_columns(path)
+        if table is not None and columnar:
+            return table
+        elif table is not None and table.validated:
+            return ValidTable(table, table.header)
+        elif table is not None:
+            return table.to_rows()
+    with open(path, "r") as f:
+        if columnar:
+            return read_columns(f)
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, [])
+        rows = []
+        valid = True
+        for values in reader:
+            if not values:
+                continue
+            if len(values) != len(header):
+                valid = False
+            rows.append(make_row(header, values))
+    if valid:
+        return ValidTable(rows, OrderedDict.fromkeys(header))
+    return rows
+
+
+def iter_tsv(path, offset=0, limit=None, columns=None):
+    """Given a path, read a TSV file
+    and yield one OrderedDict per row,
+    without holding the whole table in memory.
+    Given an offset, a limit, and a list of columns,
+    skip rows before the offset without making dicts for them,
+    stop reading after the limit, and keep only those columns."""
+    with open(path, "r") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, [])
+        if columns:
+            missing = [column for column in columns if column not in header]
+            if missing:
+                raise Exception(f"Unknown columns in '{path}': {', '.join(missing)}")
+            positions = [header.index(column) for column in columns]
+        stop = None
+        if limit is not None:
+            stop = offset + limit
+        for values in islice((values for values in reader if values), offset, stop):
+            if columns:
+                yield OrderedDict(
+                    (column, values[p] if p < len(values) else None)
+                    for column, p in zip(columns, positions)
+                )
+            else:
+                yield make_row(header, values)
+
+
+def read_tsv_page(path, offset=0, limit=None, columns=None):
+    """Given a path, an offset, a limit, and a list of columns,
+    read just that page of a TSV file with just those columns into a new Table,
+    appending the values straight to its columns without making a dict for each row."""
     with open(path, "r") as f:
-        return list(csv.DictReader(f, delimiter="\t"))
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, [])
+        keys = columns or header
+        missing = [key for key in keys if key not in header]
+        if missing:
+            raise Exception(f"Unknown columns in '{path}': {', '.join(missing)}")
+        positions = [header.index(key) for key in keys]
+        width = len(header)
+        table = Table(keys)
+        valid = True
+        stop = None
+        if limit is not None:
+            stop = offset + limit
+        for values in islice((values for values in reader if values), offset, stop):
+            if len(values) > width:
+                raise Exception(f"Line {reader.line_num} has more values than the header")
+            if len(values) < width:
+                valid = False
+            for column, p in zip(table.columns, positions):
+                column.append(values[p] if p < len(values) else None)
+    table.validated = valid
+    return table
+
+
+def make_row(header, values):
+    """Given a header list and a list of values, return an OrderedDict.
+    Like csv.DictReader, missing values are None
+    and extra values are stored as a list under the None key."""
+    row = OrderedDict(zip(header, values))
+    if len(values) > len(header):
+        row[None] = values[len(header) :]
+    elif len(values) < len(header):
+        for key in header[len(values) :]:
+            row[key] = None
+    return row
+
+
+def read_tsv_header(path):
+    """Given a path, read just the first line of a TSV file
+    and return the list of keys."""
+    with open(path, "r") as f:
+        return next(csv.reader(f, delimiter="\t"), [])
+
+
+def read_last_row(path, block_size=4096):
+    """Given a path, read the last row of a TSV file
+    by reading backwards from the end of the file,
+    and return an OrderedDict, or None if there are no rows.
+    If the last row spans several lines, fall back to reading the whole file."""
+    header = read_tsv_header(path)
+    with open(path, "rb") as f:
+        end = f.seek(0, io.SEEK_END)
+        position = end
+        tail = b""
+        while position > 0:
+            position = max(0, position - block_size)
+            f.seek(position)
+            tail = f.read(end - position)
+            if tail.rstrip(b"\r\n").count(b"\n") > 0:
+                break
+    # Only decode after the last newline,
+    # because the block may start in the middle of a multi-byte character.
+    body = tail.rstrip(b"\r\n")
+    newline = body.rfind(b"\n")
+    if newline < 0:
+        return None
+    line = body[newline + 1 :].decode("utf-8").rstrip("\r")
+    values = next(csv.reader([line], delimiter="\t"), [])
+    if len(values) != len(header):
+        row = None
+        for row in iter_tsv(path):
+            pass
+        return row
+    return OrderedDict(zip(header, values))
+
+
+def read_columns(f):
+    """Given a TSV file, read it into a new Table."""
+    reader = csv.reader(f, delimiter="\t")
+    table = Table(next(reader, []))
+    width = len(table.header)
+    columns = table.columns
+    valid = True
+    for values in reader:
+        if not values:
+            continue
+        if len(values) > width:
+            raise Exception(f"Line {reader.line_num} has more values than the header")
+        if len(values) < width:
+            valid = False
+        for i in range(0, width):
+            columns[i].append(values[i] if i < len(values) else None)
+    table.validated = valid
+    return table
+
+
+# # Cache
+#
+# When `cache_dir` is set, from the CVDB_CACHE environment variable,
+# each TSV file that is read is also saved there as a pickled Table.
+# Later reads load the pickle instead of parsing the TSV,
+# as long as the TSV file's mtime and size are unchanged.
+
+
+def get_cache_path(path):
+    """Given a TSV path, return the path of its cached Table."""
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, name + ".pickle")
+
+
+def read_cached_columns(path):
+    """Given a TSV path, return the cached Table if it is current,
+    otherwise read the TSV file into a Table and cache it.
+    Return None if the file cannot be read as a Table."""
+    stat = os.stat(path)
+    cache_path = get_cache_path(path)
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return cached["table"]
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+        pass
+
+    try:
+        with open(path, "r") as f:
+            table = read_columns(f)
+    except Exception:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        cached = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "table": table}
+        pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, cache_path)
+    return table
 
 
 def table_to_lists(table):
     """Given a list of OrderedDicts of strings,
     return a list of lists of strings."""
+    if isinstance(table, Table):
+        if not table.header:
+            return []
+        return [list(table.header)] + [list(values) for values in zip(*table.columns)]
     lists = []
     if len(table) > 0:
         lists = [list(table[0].keys())]
@@ -67,7 +530,12 @@ def table_to_lists(table):
 
 def write_tsv_io(f, table):
     w = csv.writer(f, delimiter="\t", lineterminator="\n")
-    w.writerows(table_to_lists(table))
+    if isinstance(table, Table):
+        if table.header:
+            w.writerow(table.header)
+        w.writerows(zip(*table.columns))
+    else:
+        w.writerows(table_to_lists(table))
 
 
 def write_tsv(table, path):
@@ -77,14 +545,316 @@ def write_tsv(table, path):
         write_tsv_io(f, table)
 
 
+def write_tsv_stream(rows, path):
+    """Given an iterable of OrderedDicts and a path,
+    write each row to the TSV file as it arrives,
+    and return the number of rows written."""
+    count = 0
+    with open(path, "w") as f:
+        w = csv.writer(f, delimiter="\t", lineterminator="\n")
+        for row in rows:
+            if count == 0:
+                w.writerow(row.keys())
+            w.writerow(row.values())
+            count += 1
+    return count
+
+
+def append_tsv(rows, path):
+    """Given an iterable of OrderedDicts and a path,
+    append the rows to the end of the TSV file without reading its body,
+    writing the header first if the file is new or empty,
+    and return the number of rows written."""
+    header = None
+    if os.path.isfile(path) and os.path.getsize(path) > 0:
+        header = read_tsv_header(path)
+        with open(path, "rb") as f:
+            f.seek(-1, io.SEEK_END)
+            if f.read(1) != b"\n":
+                raise Exception(f"File '{path}' does not end with a newline")
+    count = 0
+    with open(path, "a") as f:
+        w = csv.writer(f, delimiter="\t", lineterminator="\n")
+        for row in rows:
+            if header is None:
+                header = list(row.keys())
+                w.writerow(header)
+            if list(row.keys()) != header:
+                raise Exception(f"Row keys {list(row.keys())} do not match header of '{path}'")
+            w.writerow(row.values())
+            count += 1
+    return count
+
+
+# # Row Indexes
+#
+# A row index maps the values in a key column of a TSV file
+# to the byte offset and length of their rows,
+# so that single rows can be read and replaced without parsing the whole file.
+# The index is saved as JSON, and rebuilt whenever the TSV file changes.
+# The key can be one column or a list of columns,
+# in which case the key values are joined with tabs.
+# Every row must have a different key value.
+
+
+def get_key_columns(key):
+    """Given a key column or a list of key columns, return a list of key columns."""
+    if isinstance(key, str):
+        return [key]
+    return list(key)
+
+
+def get_key_value(row, key):
+    """Given an OrderedDict and a key column or a list of key columns, return the key value."""
+    return "\t".join(str(row[column]) for column in get_key_columns(key))
+
+
+def build_row_index(path, key):
+    """Given a TSV path and a key column or list of key columns,
+    return a new row index dictionary.
+    Raise an exception if two rows have the same key value."""
+    header = read_tsv_header(path)
+    for column in get_key_columns(key):
+        if column not in header:
+            raise Exception(f"Key '{column}' is not in the header of '{path}'")
+    positions = [header.index(column) for column in get_key_columns(key)]
+    rows = {}
+    with open(path, "rb") as f:
+        offset = len(f.readline())
+        start = offset
+        record = b""
+        for line in f:
+            if not record:
+                start = offset
+            record += line
+            offset += len(line)
+            # A quoted value can span lines, so wait for the closing quote
+            if record.count(b'"') % 2 == 1:
+                continue
+            if record.strip():
+                values = next(csv.reader([record.decode("utf-8")], delimiter="\t"))
+                value = "\t".join(values[p] for p in positions)
+                if value in rows:
+                    raise Exception(f"Duplicate key '{value}' in '{path}'")
+                rows[value] = [start, len(record)]
+            record = b""
+    stat = os.stat(path)
+    return {
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "key": key,
+        "header": header,
+        "rows": rows,
+    }
+
+
+def save_row_index(index, index_path):
+    """Given a row index and a path, save the index as JSON."""
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(temp_path, index_path)
+
+
+def index_tsv(path, key, index_path):
+    """Given a TSV path, a key column, and the path for the saved index,
+    return the saved row index if it is still current for the TSV file,
+    otherwise build a new row index and save it."""
+    stat = os.stat(path)
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        if (
+            index["mtime"] == stat.st_mtime_ns
+            and index["size"] == stat.st_size
+            and index["key"] == key
+        ):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build_row_index(path, key)
+    save_row_index(index, index_path)
+    return index
+
+
+def read_indexed_row(path, index, value):
+    """Given a TSV path, its row index, and a key value,
+    read just that row and return an OrderedDict, or None if there is no such row."""
+    if value not in index["rows"]:
+        return None
+    offset, length = index["rows"][value]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        record = f.read(length).decode("utf-8")
+    values = next(csv.reader([record], delimiter="\t"))
+    return OrderedDict(zip(index["header"], values))
+
+
+def replace_indexed_row(path, index, index_path, row):
+    """Given a TSV path, its row index, the path for the saved index,
+    and an OrderedDict with the same keys as the header,
+    replace the row with the same key value.
+    When the new row has the same width it is written in place,
+    otherwise only the rest of the file after the row is rewritten.
+    Then save the updated index."""
+    if list(row.keys()) != index["header"]:
+        raise Exception(f"Row keys {list(row.keys())} do not match header of '{path}'")
+    value = get_key_value(row, index["key"])
+    if value not in index["rows"]:
+        raise Exception(f"No row for '{value}' in '{path}'")
+    offset, length = index["rows"][value]
+    s = io.StringIO()
+    csv.writer(s, delimiter="\t", lineterminator="\n").writerow(row.values())
+    record = s.getvalue().encode("utf-8")
+
+    with open(path, "r+b") as f:
+        if len(record) == length:
+            f.seek(offset)
+            f.write(record)
+        else:
+            f.seek(offset + length)
+            rest = f.read()
+            f.seek(offset)
+            f.write(record + rest)
+            f.truncate()
+
+    shift = len(record) - length
+    if shift:
+        for position in index["rows"].values():
+            if position[0] > offset:
+                position[0] += shift
+    index["rows"][value] = [offset, len(record)]
+    stat = os.stat(path)
+    index["mtime"] = stat.st_mtime_ns
+    index["size"] = stat.st_size
+    save_row_index(index, index_path)
+    return index
+
+
+def upsert_tsv(rows, path, key):
+    """Given an iterable of OrderedDicts, a TSV path, and a key column or list of key columns,
+    replace the rows that have the same key values and append the other rows,
+    leaving every other line of the file byte-for-byte unchanged.
+    Return a pair of the number of rows replaced and the number appended."""
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        rows = list(rows)
+        seen = set()
+        for row in rows:
+            for column in get_key_columns(key):
+                if column not in row:
+                    raise Exception(f"Key '{column}' is not in rows for '{path}'")
+            value = get_key_value(row, key)
+            if value in seen:
+                raise Exception(f"Duplicate key '{value}' in rows for '{path}'")
+            seen.add(value)
+        write_tsv_stream(rows, path)
+        return 0, len(rows)
+
+    index = build_row_index(path, key)
+    replacements = {}
+    appended = []
+    seen = set()
+    for row in rows:
+        if list(row.keys()) != index["header"]:
+            raise Exception(f"Row keys {list(row.keys())} do not match header of '{path}'")
+        value = get_key_value(row, key)
+        if value in seen:
+            raise Exception(f"Duplicate key '{value}' in rows for '{path}'")
+        seen.add(value)
+        s = io.StringIO()
+        csv.writer(s, delimiter="\t", lineterminator="\n").writerow(row.values())
+        record = s.getvalue().encode("utf-8")
+        if value in index["rows"]:
+            offset, length = index["rows"][value]
+            replacements[offset] = (length, record)
+        else:
+            appended.append(record)
+
+    temp_path = path + ".tmp"
+    with open(path, "rb") as source, open(temp_path, "wb") as output:
+        position = 0
+        for offset in sorted(replacements):
+            length, record = replacements[offset]
+            output.write(source.read(offset - position))
+            output.write(record)
+            source.seek(length, io.SEEK_CUR)
+            position = offset + length
+        rest = source.read()
+        output.write(rest)
+        if rest and not rest.endswith(b"\n") and appended:
+            output.write(b"\n")
+        for record in appended:
+            output.write(record)
+    os.replace(temp_path, path)
+    return len(replacements), len(appended)
+
+
 def table_to_tsv_string(table):
     w = io.StringIO()
     write_tsv_io(w, table)
     return w.getvalue()
 
 
+def slice_rows(rows, offset=0, limit=None, columns=None):
+    """Given an iterable of OrderedDicts, an offset, an optional limit,
+    and an optional list of columns,
+    yield just that page of rows with just those columns."""
+    stop = None
+    if limit is not None:
+        stop = offset + limit
+    for row in islice(rows, offset, stop):
+        if columns:
+            row = OrderedDict((column, row[column]) for column in columns)
+        yield row
+
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def print_rows(rows, sample_size=QUICK_SAMPLE_SIZE):
+    """Given an iterable of OrderedDicts, print them as a plain text table.
+    Column widths are fixed from a sample of the first rows,
+    then the remaining rows are printed as they arrive."""
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+    if len(sample) < 1:
+        print("Empty table")
+        return
+
+    keys = list(sample[0].keys())
+    lists = [["" if v is None else str(v) for v in row.values()] for row in sample]
+    widths = []
+    numeric = []
+    for i, key in enumerate(keys):
+        values = [values[i] for values in lists if i < len(values)]
+        widths.append(max([len(str(key))] + [len(v) for v in values]))
+        numbers = [v for v in values if v.strip() != ""]
+        numeric.append(len(numbers) > 0 and all(is_number(v) for v in numbers))
+
+    def format_line(values):
+        cells = []
+        for i, value in enumerate(values):
+            if i >= len(widths):
+                cells.append(value)
+            elif numeric[i]:
+                cells.append(value.rjust(widths[i]))
+            else:
+                cells.append(value.ljust(widths[i]))
+        return "  ".join(cells).rstrip()
+
+    print(format_line([str(key) for key in keys]))
+    print("  ".join("-" * width for width in widths))
+    for values in lists:
+        print(format_line(values))
+    for row in rows:
+        print(format_line(["" if v is None else str(v) for v in row.values()]))
+
+
 def print_tsv(table):
-    lists = table_to_lists(table)
-    if len(lists) > 0:
-        print(tabulate(lists[1:], lists[0]))
-    print("Empty table")
+    print_rows(table)
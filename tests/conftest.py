@@ -0,0 +1,14 @@
+import pytest
+
+from git import Repo
+from covicdbtools import config
+
+
+@pytest.fixture
+def temp_repos(tmp_path, monkeypatch):
+    """Replace the secret, staging, and public repositories
+    with new, empty git repositories for just one test,
+    and return the directory that holds them."""
+    for name in config.repo_names:
+        monkeypatch.setattr(config, name, Repo.init(str(tmp_path / name), mkdir=True))
+    return tmp_path
@@ -1,4 +1,7 @@
-from covicdbtools import tables, workbooks, antibodies, api
+import os
+import shutil
+
+from covicdbtools import config, tables, workbooks, antibodies, api
 from covicdbtools.responses import succeeded, failed
 from .test_requests import UploadedFile
 
@@ -67,3 +70,32 @@ def test_pathological():
     assert succeeded(response)
     tables.print_tsv(response["table"])
     assert len(response["table"]) == 9
+
+
+def test_submit(temp_repos):
+    paths = []
+    for name in config.repo_names:
+        path = os.path.join(getattr(config, name).working_tree_dir, "antibodies.tsv")
+        shutil.copyfile(f"tests/submit-antibodies/data/{name}/antibodies.tsv", path)
+        paths.append(path)
+    table = tables.read_tsv("examples/antibodies-submission-valid.tsv")
+    response = antibodies.submit("A", "a@b.c", "LJI", table)
+    assert succeeded(response)
+    row = response["table"][0]
+    assert row["ab_id"] == "COVIC:11"
+    assert row["host_id"] == config.ids["human (Homo sapiens)"]
+    assert tables.read_tsv(paths[2])[10]["host_id"] == row["host_id"]
+
+
+def test_submit_checks_public(temp_repos):
+    # Secret and staging have the same last ID, but public has no antibodies
+    staging_path = os.path.join(config.staging.working_tree_dir, "antibodies.tsv")
+    shutil.copyfile("tests/submit-antibodies/data/staging/antibodies.tsv", staging_path)
+    secret_path = os.path.join(config.secret.working_tree_dir, "antibodies.tsv")
+    last_id = antibodies.read_last_id(staging_path)
+    with open(secret_path, "w") as f:
+        f.write(f"ab_id\n{last_id}\n")
+    table = tables.read_tsv("examples/antibodies-submission-valid.tsv")
+    response = antibodies.submit("A", "a@b.c", "LJI", table)
+    assert failed(response)
+    assert response["message"] == f"Different last public antibody ID: None != {last_id}"
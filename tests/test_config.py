@@ -0,0 +1,126 @@
+import json
+import os
+import pytest
+
+from covicdbtools import config
+
+
+def test_snapshot(tmp_path):
+    path = os.path.join(os.path.dirname(config.__file__), "config.json")
+    expected = config.read(path)
+    snapshot_path = str(tmp_path / "config.snapshot")
+    config.save_snapshot(expected, snapshot_path)
+
+    actual = config.load_snapshot(snapshot_path)
+    assert actual == json.loads(json.dumps(expected))
+
+    shared = config.load_snapshot(snapshot_path, shared=True)
+    assert config.is_config(shared)
+    assert isinstance(shared["labels"], config.StringTable)
+    assert dict(shared["labels"]) == expected["labels"]
+    assert shared["ids"]["neutralization"] == expected["ids"]["neutralization"]
+    assert "foo" not in shared["ids"]
+
+
+def test_incremental_build(tmp_path):
+    labels_path = str(tmp_path / "labels.tsv")
+    with open(labels_path, "w") as f:
+        f.write("ID\tLABEL\n")
+        for id, label in config.labels.items():
+            f.write(f"{id}\t{label}\n")
+    names = [
+        "prefix",
+        "field",
+        "core",
+        "ab_control",
+        "host",
+        "isotype",
+        "light_chain",
+        "heavy_chain_germline",
+        "assay",
+        "parameter",
+        "qualitative_measure",
+        "death_reason",
+        "animal_model_strain",
+    ]
+    paths = [f"ontology/{name}.tsv" for name in names] + [labels_path]
+    first = config.build(*paths)
+    assert config.is_config(first)
+    assert first["hashes"]["hosts"] == config.hash_file("ontology/host.tsv")
+
+    second = config.build(*paths, previous=first)
+    assert second == first
+    assert second["hosts"] is first["hosts"]
+
+    with open(labels_path, "a") as f:
+        f.write("ex:1\tnew label\n")
+    third = config.build(*paths, previous=second)
+    assert third["hosts"] is first["hosts"]
+    assert third["labels"]["ex:1"] == "new label"
+
+
+def test_term_index():
+    term_set, term = config.find_term("neutralization")
+    assert term_set == "assays"
+    assert config.find_term(term["id"]) == (term_set, term)
+    assert config.find_term("  Neutralization ") == (term_set, term)
+    assert config.get_term_set("foo") is None
+    assert "neutralization" in config.get_term_labels("assays")
+
+
+def test_blinded_antibodies():
+    path = os.path.join(config.get_repo("staging").working_tree_dir, "antibodies.tsv")
+    with open(path) as f:
+        original = f.read()
+    try:
+        first = config.get_blinded_antibodies()
+        assert config.get_blinded_antibodies() is first
+        assert "COVIC:1" in first["ab_ids"]
+        assert first["ids_by_label"]["COVIC-1"] == "COVIC:1"
+
+        with open(path, "a") as f:
+            f.write("COVIC:9999\n")
+        second = config.get_blinded_antibodies()
+        assert second is not first
+        assert "COVIC-9999" in second["ab_labels"]
+    finally:
+        with open(path, "w") as f:
+            f.write(original)
+
+
+def test_reload(tmp_path):
+    path = os.path.join(os.path.dirname(config.__file__), "config.json")
+    expected = config.read(path)
+    config_path = str(tmp_path / "config.json")
+    config.save(expected, config_path)
+    try:
+        first = config.reload(config_path)
+        assert config.get_state() is first
+        assert not config.reload_if_changed()
+
+        expected["hosts"]["test host"] = {"id": "NCBITaxon:0", "label": "test host"}
+        config.save(expected, config_path)
+        os.utime(config_path, ns=(0, 0))
+        assert config.reload_if_changed()
+        second = config.get_state()
+        assert second.version == first.version + 1
+        assert "test host" in config.hosts
+        assert "test host" not in first.hosts
+
+        with open(config_path, "w") as f:
+            f.write("{}")
+        with pytest.raises(Exception):
+            config.reload(config_path)
+        assert config.get_state() is second
+    finally:
+        config.reload(path)
+
+
+def test_column_catalog():
+    header = config.get_column("obi_0001643_normalized")
+    assert header["label"] == "neutralization normalized value"
+    assert config.get_column("obi_0001643")["label"] == "neutralization"
+    assert config.get_column("obi_0001643_foo") is None
+    assert config.parse_column("obi_0001643_foo") == ("OBI:0001643", "_foo")
+    assert config.parse_column("ontie_0003576") == ("ONTIE:0003576", "")
+    assert config.parse_column("foo") is None
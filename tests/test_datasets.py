@@ -1,4 +1,9 @@
-from covicdbtools import tables, workbooks, datasets, api
+import json
+import os
+import pytest
+
+from collections import OrderedDict
+from covicdbtools import config, grids, tables, workbooks, datasets, api
 from covicdbtools.responses import succeeded, failed
 from .test_requests import UploadedFile
 
@@ -21,6 +26,17 @@ def test_get_assay_header():
     assert header["label"] == "neutralization normalized value"
 
 
+def test_get_assay_headers():
+    headers = datasets.get_assay_headers("spr")
+    assert datasets.get_assay_headers("spr") is headers
+    assert headers[0]["value"] == "ab_label"
+    with pytest.raises(TypeError):
+        headers[0]["label"] = "foo"
+    header = headers[0].copy()
+    header["label"] = "foo"
+    assert headers[0]["label"] != "foo"
+
+
 def test_validate_submission():
     path = "examples/spr-submission-valid.xlsx"
     table = workbooks.read(path, "Dataset")
@@ -65,3 +81,215 @@ def test_examples():
         tsv = tables.read_tsv("examples/{0}.tsv".format(example))
         excel = workbooks.read("examples/{0}.xlsx".format(example))
         assert tables.table_to_lists(tsv)[1:] == tables.table_to_lists(excel)[1:]
+
+
+def test_scan_last_dataset_id(tmp_path):
+    assert datasets.scan_last_dataset_id(str(tmp_path)) == 0
+    for name in ["1", "12", "3", "4x"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "20").write_text("")
+    assert datasets.scan_last_dataset_id(str(tmp_path)) == 12
+
+
+def test_secret_values(temp_repos):
+    path = os.path.join(config.secret.working_tree_dir, "datasets.tsv")
+    datasets.write_secret_record(OrderedDict({"ds_id": "99", "submitter_email": "a@b.c"}))
+    datasets.set_secret_values("99", {"submitter_email": "x@y.z", "note": "Hello"})
+    assert datasets.get_secret_value("99", "submitter_email") == "x@y.z"
+    assert datasets.get_value("all", "99", "note") == "Hello"
+    assert tables.read_tsv(path)[-1] == OrderedDict(
+        {"ds_id": "99", "submitter_email": "x@y.z", "note": "Hello"}
+    )
+
+    datasets.write_secret_record(OrderedDict({"ds_id": "100", "submitter_email": "d@e.f"}))
+    assert datasets.get_value("secret", "100", "note") == ""
+    assert datasets.get_value("all", "100", "note") == ""
+
+
+def test_set_values(temp_repos):
+    datasets.write_secret_record(OrderedDict({"ds_id": "98", "submitter_email": "a@b.c"}))
+    response = api.set_values("secret", "98", {"submitter_email": "x@y.z", "lab": "LJI"})
+    assert succeeded(response)
+    assert config.secret.head.commit.message == "Set submitter_email, lab for dataset 98"
+    assert datasets.get_secret_value("98") == OrderedDict(
+        {"ds_id": "98", "submitter_email": "x@y.z", "lab": "LJI"}
+    )
+    assert failed(api.set_values("secret", "98", {"ds_id": "1"}))
+    assert failed(api.set_values("secret", "98", {}))
+
+
+def test_promote_datasets_checks_first():
+    response = datasets.promote_datasets("A", "a@b.c", ["97", "97"])
+    assert failed(response)
+    response = api.promote_datasets("A", "a@b.c", ["96", "97"])
+    assert failed(response)
+    assert len(response["errors"]) == 4
+
+
+def test_read_checks_plain_lists():
+    table = [OrderedDict({"foo": str(i)}) for i in range(0, 1000)]
+    assert succeeded(api.read(table))
+    table[1] = OrderedDict({"foo": 1})
+    with pytest.raises(Exception):
+        api.read(table)
+
+
+def test_label_assays():
+    rows = [OrderedDict({"ab_id": "COVIC:1", "n": "3", "foo": "bar"})]
+    assays = tables.Table.from_rows(rows)
+    table = api.label_assays("spr", assays)
+    assert table.header == ("Antibody", "n", "foo")
+    assert table == [OrderedDict({"Antibody": "COVIC:1", "n": "3", "foo": "bar"})]
+    assert table.columns[1] is assays.columns[1]
+
+
+def test_fetch_data():
+    response = datasets.create("A", "a@b.c", columns=["ab_label", "tested_antigen", "n"])
+    dataset_id = str(response["dataset_id"])
+    columns = ["Antibody label", "Tested antigen", "n"]
+    rows = workbooks.read("examples/spr-submission-valid.xlsx", "Dataset")
+    rows = [OrderedDict((column, row[column]) for column in columns) for row in rows]
+    assert succeeded(datasets.submit("A", "a@b.c", dataset_id, rows))
+
+    response = api.fetch_data(dataset_id, 1, 2, include=["table", "label_table"])
+    assert succeeded(response)
+    assert isinstance(response["table"], tables.Table)
+    assert response["label_table"].columns[0] is response["table"].columns[0]
+
+    response = api.fetch_data(dataset_id, 1, 2, include=["table", "label_table"], as_rows=True)
+    assert type(response["table"]) is list
+    assert response["table"] == [
+        OrderedDict(
+            {"ab_id": "COVIC:1", "tested_antigen": rows[i]["Tested antigen"], "n": rows[i]["n"]}
+        )
+        for i in [1, 2]
+    ]
+    assert response["label_table"][0] == OrderedDict(
+        {"Antibody": "COVIC:1", "Tested antigen": rows[1]["Tested antigen"], "n": rows[1]["n"]}
+    )
+    json.dumps({key: response[key] for key in ["table", "label_table"]})
+    assert failed(api.fetch_data(dataset_id, -1))
+
+
+def test_list_datasets():
+    response = datasets.create("A", "a@b.c", columns=["ab_label", "n"])
+    assert succeeded(response)
+    dataset_id = str(response["dataset_id"])
+    entries = api.list_datasets({"status": "configured", "columns": ["n"]})["datasets"]
+    entry = [entry for entry in entries if entry["ds_id"] == dataset_id][0]
+    assert entry["columns"] == ["ab_label", "n"]
+    assert entry["rows"] == 0
+    assert entry["commit"] == config.staging.head.commit.hexsha
+
+    datasets.set_staging_value(dataset_id, "Dataset status", "submitted")
+    entries = api.list_datasets({"status": "configured"})["datasets"]
+    assert dataset_id not in [entry["ds_id"] for entry in entries]
+
+    os.remove(datasets.get_catalog_path())
+    entries = api.list_datasets({"status": "submitted"})["datasets"]
+    assert dataset_id in [entry["ds_id"] for entry in entries]
+
+    # Other staging commits advance the catalog without rebuilding it
+    head = datasets.get_head(config.staging)
+    path = os.path.join(config.staging.working_tree_dir, "other.txt")
+    with open(path, "w") as f:
+        f.write("other\n")
+    config.staging.index.add([path])
+    config.staging.index.commit("Other", author=config.covic, committer=config.covic)
+    datasets.update_catalog([], head)
+    assert datasets.read_saved_catalog()["head"] == config.staging.head.commit.hexsha
+
+
+def test_catalog_failure(temp_repos, monkeypatch, capsys):
+    def fail(*args):
+        raise Exception("No catalog")
+
+    datasets.list_datasets()
+    with monkeypatch.context() as m:
+        m.setattr(datasets, "read_catalog_entry", fail)
+        response = datasets.create("A", "a@b.c", columns=["ab_label", "n"])
+    assert succeeded(response)
+    assert "Failed to update the dataset catalog" in capsys.readouterr().err
+    assert not os.path.exists(datasets.get_catalog_path())
+
+    entries = datasets.list_datasets()
+    assert [entry["ds_id"] for entry in entries] == [str(response["dataset_id"])]
+
+
+def test_submit_modes(monkeypatch):
+    response = datasets.create("A", "a@b.c", columns=["ab_label", "tested_antigen", "n"])
+    assert succeeded(response)
+    dataset_id = str(response["dataset_id"])
+    path = os.path.join(datasets.get_staging_path(dataset_id), "assays.tsv")
+    columns = ["Antibody label", "Tested antigen", "n"]
+    rows = workbooks.read("examples/spr-submission-valid.xlsx", "Dataset")
+    rows = [OrderedDict((column, row[column]) for column in columns) for row in rows]
+
+    def get_rows():
+        return [e["rows"] for e in datasets.list_datasets() if e["ds_id"] == dataset_id][0]
+
+    # The catalog row counts are kept without reading the assays again
+    assert get_rows() == 0
+    monkeypatch.setattr(datasets, "count_assays", None)
+    monkeypatch.setattr(datasets, "build_catalog", None)
+
+    response = datasets.submit("A", "a@b.c", dataset_id, rows[:2], mode="append")
+    assert succeeded(response)
+    response = datasets.submit("A", "a@b.c", dataset_id, rows[:3], mode="append")
+    assert succeeded(response)
+    assert config.staging.head.commit.message == f"Append 3 assays to dataset {dataset_id}"
+    assert [row["n"] for row in tables.read_tsv(path)] == ["6", "4", "6", "4", "6"]
+    assert get_rows() == 5
+
+    # Without a "Replicate key" the key is just "ab_id", which these assays repeat
+    with open(path) as f:
+        before = f.read()
+    response = datasets.submit("A", "a@b.c", dataset_id, rows[:1], mode="upsert")
+    assert failed(response)
+    with open(path) as f:
+        assert f.read() == before
+
+    datasets.set_staging_value(dataset_id, "Replicate key", "tested_antigen")
+    response = datasets.submit("A", "a@b.c", dataset_id, rows[:1] * 2, mode="upsert")
+    assert failed(response)
+    assert response["errors"] == [
+        "Error in row 3: Duplicate replicate key 'COVIC-1, Spike protein 1', also in row 2"
+    ]
+    datasets.set_staging_value(dataset_id, "Replicate key", "[tested_antigen, foo]")
+    response = datasets.submit("A", "a@b.c", dataset_id, rows[:1], mode="upsert")
+    assert failed(response)
+    assert response["errors"] == ["Replicate key columns are not in the dataset: foo"]
+    assert len(tables.read_tsv(path)) == 5
+
+    datasets.set_staging_value(dataset_id, "Replicate key", "tested_antigen")
+    datasets.submit("A", "a@b.c", dataset_id, rows[:2], mode="replace")
+    assert get_rows() == 2
+    changed = OrderedDict(rows[1], n="9")
+    response = datasets.submit("A", "a@b.c", dataset_id, [changed] + rows[2:4], mode="upsert")
+    assert succeeded(response)
+    message = f"Update 1 and add 2 assays in dataset {dataset_id}"
+    assert config.staging.head.commit.message == message
+    assert [row["n"] for row in tables.read_tsv(path)] == ["6", "9", "6", rows[3]["n"]]
+    assert get_rows() == 4
+
+
+def test_read_yaml(tmp_path):
+    path = str(tmp_path / "dataset.yml")
+    datasets.write_yaml({"Dataset ID": "ds:1", "Columns": ["ab_label", "n"]}, path)
+    first = datasets.read_yaml(path)
+    assert first == {"Dataset ID": "ds:1", "Columns": ["ab_label", "n"]}
+    first["Columns"].append("foo")
+    assert datasets.read_yaml(path)["Columns"] == ["ab_label", "n"]
+
+    datasets.write_yaml({"Dataset ID": "ds:2"}, path)
+    os.utime(path, ns=(0, 0))
+    assert datasets.read_yaml(path) == {"Dataset ID": "ds:2"}
+
+
+def test_fill_grid():
+    table = workbooks.read("examples/spr-submission-valid.xlsx", "Dataset")
+    response = datasets.validate("spr", table)
+    assert grids.validate_grid(response["grid"]) is None
+    grid = datasets.fill("spr", response["grid"]["rows"])[1]
+    assert grids.validate_grid(grid) is None
+    assert succeeded(api.convert(grid, "html"))
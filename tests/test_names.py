@@ -1,6 +1,6 @@
 from collections import OrderedDict
 
-from covicdbtools import names
+from covicdbtools import config, names, tables
 
 
 def test_prefixes():
@@ -40,3 +40,17 @@ def test_labelled_table():
     labelled_table = [OrderedDict({"foo_id": "bar", "foo_label": "Bar"})]
     assert names.label_table(labels, concise_table) == labelled_table
     assert names.unlabel_table(labelled_table) == concise_table
+
+    table = tables.Table.from_rows(concise_table)
+    labelled = names.label_table(labels, table)
+    assert isinstance(labelled, tables.Table)
+    assert labelled == [OrderedDict({"foo_id": "bar", "foo_label": "Bar"})]
+
+
+def test_encode_table():
+    table = tables.read_tsv("tests/submit-antibodies/data/staging/antibodies.tsv", columnar=True)
+    names.encode_table(table)
+    assert isinstance(table.column("host_id"), tables.Categorical)
+    labelled = names.label_table(config.labels, table)
+    assert isinstance(labelled.column("host_label"), tables.Categorical)
+    assert labelled == names.label_table(config.labels, table.to_rows())
@@ -1,3 +1,6 @@
+import os
+import pytest
+
 from collections import OrderedDict
 
 from covicdbtools import tables
@@ -30,3 +33,210 @@ bar	1
 baz	2
 """
     assert tables.table_to_tsv_string(table) == string
+
+
+def test_columnar_table():
+    rows = [
+        OrderedDict({"foo": "bar", "a": "1"}),
+        OrderedDict({"foo": "baz", "a": "2"}),
+    ]
+    table = tables.Table.from_rows(rows)
+    assert table.header == ("foo", "a")
+    assert table.column("a") == ["1", "2"]
+    assert len(table) == 2
+    assert table[1] == rows[1]
+    assert table == rows
+    assert tables.is_table(table)
+    assert tables.table_to_tsv_string(table) == tables.table_to_tsv_string(rows)
+
+    table.columns[1][0] = 1
+    assert not tables.is_table(table)
+
+    columns = [["bar"], ["1"]]
+    assert tables.Table(["foo", "a"], columns).columns[0] is not columns[0]
+    assert tables.Table(["foo", "a"], columns, copy=False).columns[0] is columns[0]
+
+
+def test_read_columns(tmp_path):
+    path = tmp_path / "table.tsv"
+    path.write_text("foo\ta\nbar\t1\nbaz\t2\n")
+    table = tables.read_tsv(path, columnar=True)
+    assert isinstance(table, tables.Table)
+    assert table == tables.read_tsv(path)
+
+
+def test_stream_tsv(tmp_path):
+    path = tmp_path / "table.tsv"
+    rows = (OrderedDict({"foo": str(i), "a": "x"}) for i in range(0, 3))
+    assert tables.write_tsv_stream(rows, path) == 3
+    assert path.read_text() == "foo\ta\n0\tx\n1\tx\n2\tx\n"
+    rows = tables.iter_tsv(path)
+    assert next(rows) == OrderedDict({"foo": "0", "a": "x"})
+    assert len(list(rows)) == 2
+
+
+def test_append_tsv(tmp_path):
+    path = tmp_path / "table.tsv"
+    assert tables.append_tsv([OrderedDict({"foo": "0", "a": "x"})], path) == 1
+    assert tables.read_last_row(path) == OrderedDict({"foo": "0", "a": "x"})
+    rows = [OrderedDict({"foo": str(i), "a": "y" * i}) for i in range(1, 20)]
+    assert tables.append_tsv(rows, path) == 19
+    assert tables.read_tsv(path)[1:] == rows
+    assert tables.read_last_row(path, block_size=8) == rows[-1]
+
+    path.write_text("foo\ta\n")
+    assert tables.read_last_row(path) is None
+
+    rows = [OrderedDict({"foo": str(i), "a": "µ" * i}) for i in range(0, 20)]
+    tables.write_tsv(rows, path)
+    for block_size in range(1, 40):
+        assert tables.read_last_row(path, block_size=block_size) == rows[-1]
+
+
+def test_row_index(tmp_path):
+    path = str(tmp_path / "table.tsv")
+    index_path = str(tmp_path / "index" / "table.json")
+    rows = [OrderedDict({"id": str(i), "a": "x" * i}) for i in range(0, 5)]
+    tables.write_tsv(rows, path)
+    index = tables.index_tsv(path, "id", index_path)
+    assert tables.read_indexed_row(path, index, "3") == rows[3]
+    assert tables.read_indexed_row(path, index, "5") is None
+
+    row = OrderedDict({"id": "3", "a": "yyy"})
+    index = tables.replace_indexed_row(path, index, index_path, row)
+    row = OrderedDict({"id": "2", "a": "z\tz"})
+    index = tables.replace_indexed_row(path, index, index_path, row)
+    assert tables.index_tsv(path, "id", index_path) == index
+    assert tables.read_indexed_row(path, index, "4") == rows[4]
+    assert tables.read_indexed_row(path, index, "2") == row
+    assert tables.read_tsv(path)[2] == row
+    assert tables.build_row_index(path, "id")["rows"] == index["rows"]
+
+
+def test_upsert(tmp_path):
+    path = str(tmp_path / "table.tsv")
+    rows = [OrderedDict({"id": str(i), "rep": "1", "a": "x" * i}) for i in range(0, 4)]
+    tables.write_tsv(rows, path)
+    with open(path) as f:
+        lines = f.readlines()
+
+    new_rows = [
+        OrderedDict({"id": "2", "rep": "1", "a": "changed"}),
+        OrderedDict({"id": "2", "rep": "2", "a": "new"}),
+    ]
+    assert tables.upsert_tsv(new_rows, path, ["id", "rep"]) == (1, 1)
+    with open(path) as f:
+        new_lines = f.readlines()
+    assert new_lines[:3] + new_lines[4:5] == lines[:3] + lines[4:5]
+    assert tables.read_tsv(path) == rows[:2] + new_rows[:1] + rows[3:] + new_rows[1:]
+
+    with pytest.raises(Exception):
+        tables.upsert_tsv(new_rows[1:] * 2, path, ["id", "rep"])
+
+    duplicate_path = str(tmp_path / "duplicate.tsv")
+    tables.write_tsv(rows[:1] + rows, duplicate_path)
+    with open(duplicate_path) as f:
+        before = f.read()
+    with pytest.raises(Exception):
+        tables.upsert_tsv(new_rows, duplicate_path, ["id", "rep"])
+    with open(duplicate_path) as f:
+        assert f.read() == before
+
+    new_path = str(tmp_path / "new.tsv")
+    with pytest.raises(Exception):
+        tables.upsert_tsv(new_rows[1:] * 2, new_path, ["id", "rep"])
+    with pytest.raises(Exception):
+        tables.upsert_tsv(new_rows, new_path, ["id", "foo"])
+    assert not os.path.exists(new_path)
+
+
+def test_valid_table(tmp_path):
+    path = tmp_path / "table.tsv"
+    path.write_text("foo\ta\nbar\t1\nbaz\t2\n")
+    table = tables.read_tsv(path)
+    assert isinstance(table, tables.ValidTable)
+    assert table.header == ("foo", "a")
+    assert tables.is_table(table)
+
+    path.write_text("foo\ta\nbar\t1\nbaz\n")
+    table = tables.read_tsv(path)
+    assert not isinstance(table, tables.ValidTable)
+    assert not tables.is_table(table)
+
+    table = [OrderedDict({"foo": str(i)}) for i in range(0, 1000)]
+    table[1] = OrderedDict({"foo": 1})
+    assert tables.is_table(table, quick=True)
+    assert not tables.is_table(table)
+
+
+def test_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(tables, "cache_dir", str(tmp_path / "cache"))
+    path = tmp_path / "table.tsv"
+    path.write_text("foo\ta\nbar\t1\nbaz\t2\n")
+    table = tables.read_tsv(path)
+    assert os.path.isfile(tables.get_cache_path(path))
+    assert tables.read_tsv(path) == table
+    assert isinstance(tables.read_tsv(path), tables.ValidTable)
+    assert isinstance(tables.read_tsv(path, columnar=True), tables.Table)
+
+    path.write_text("foo\ta\nbar\t3\n")
+    assert tables.read_tsv(path) == [OrderedDict({"foo": "bar", "a": "3"})]
+
+
+def test_print_rows(capsys):
+    rows = [OrderedDict({"foo": f"bar{i}", "a": str(i * 10)}) for i in range(0, 5)]
+    tables.print_rows(tables.slice_rows(rows, offset=1, limit=2))
+    assert (
+        capsys.readouterr().out
+        == """foo    a
+----  --
+bar1  10
+bar2  20
+"""
+    )
+
+    tables.print_rows(tables.slice_rows(rows, offset=4, columns=["a"]))
+    assert capsys.readouterr().out == " a\n--\n40\n"
+
+    tables.print_rows([])
+    assert capsys.readouterr().out == "Empty table\n"
+
+
+def test_categorical():
+    table = tables.Table(["id", "host"], [["1", "2", "3", "4"], ["human", "mouse", "", "human"]])
+    table.encode("host", ["mouse", "human"])
+    column = table.column("host")
+    assert isinstance(column, tables.Categorical)
+    assert list(column.codes) == [1, 0, 2, 1]
+    assert column == ["human", "mouse", "", "human"]
+    assert tables.is_table(table)
+    assert table.select("host", "human").column("id") == ["1", "4"]
+    assert table[1:3] == [
+        OrderedDict({"id": "2", "host": "mouse"}),
+        OrderedDict({"id": "3", "host": ""}),
+    ]
+    assert tables.table_to_tsv_string(table) == "id\thost\n1\thuman\n2\tmouse\n3\t\n4\thuman\n"
+
+
+def test_iter_tsv_page(tmp_path):
+    path = str(tmp_path / "table.tsv")
+    rows = [OrderedDict({"id": str(i), "a": "x" * i, "b": "y"}) for i in range(0, 5)]
+    tables.write_tsv(rows, path)
+    assert list(tables.iter_tsv(path, offset=1, limit=2)) == rows[1:3]
+    assert list(tables.iter_tsv(path, offset=3, columns=["b", "id"])) == [
+        OrderedDict({"b": "y", "id": "3"}),
+        OrderedDict({"b": "y", "id": "4"}),
+    ]
+    assert list(tables.iter_tsv(path, offset=10)) == []
+    with pytest.raises(Exception):
+        list(tables.iter_tsv(path, columns=["foo"]))
+
+    table = tables.read_tsv_page(path, offset=1, limit=2)
+    assert table.header == ("id", "a", "b")
+    assert table.validated
+    assert table == rows[1:3]
+    table = tables.read_tsv_page(path, offset=3, columns=["b", "id"])
+    assert table == list(tables.iter_tsv(path, offset=3, columns=["b", "id"]))
+    assert len(tables.read_tsv_page(path, offset=10)) == 0
+    with pytest.raises(Exception):
+        tables.read_tsv_page(path, columns=["foo"])